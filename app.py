@@ -2,37 +2,54 @@
 Hair Color Analysis Streamlit App
 L'Oréal Hair Color Distribution Visualization with Color Remapping
 """
+import hashlib
+import html
+import io
+import os
+import re
+import tempfile
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import numpy as np
 import pandas as pd
+from PIL import Image
 from src.data_loader import (
     load_respondent_data, get_available_shades, 
     load_respondent_image, load_respondent_mask,
     build_image_path, build_mask_path
 )
-from src.color_viz import create_color_bars
-from src.color_processing import process_hair_color_remapping_with_sample, get_sample_info
-from src.swatch_loader import (
-    load_swatch_for_respondent_and_shade, extract_shade_id_from_data, 
-    get_mapping_info, reload_mappings, get_respondent_info
-)
-from src.quantile_analysis import select_representative_samples_quantile
-from src.quantile_viz import create_grid_visualization_with_images
-from config.settings import logger, CITY_FOLDERS
+from src.gcp_client import TRANSIENT_GCS_ERRORS
+# color_viz, color_processing, swatch_loader (plotly / luxpy) and the tab 2 quantile
+# modules (scipy / plotly) are imported where they are first used, so sessions that
+# never reach them do not pay for the imports
+from config.settings import logger, CITY_FOLDERS, CITY_NAMES
 
-# Page configuration
-st.set_page_config(
-    page_title="L'Oréal Hair Color Analysis",
-    page_icon="💇‍♀️",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+# Images written here are served by Streamlit at app/static/ (server.enableStaticServing)
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
 
-# Initialize session state for tab tracking
-if 'active_tab' not in st.session_state:
-    st.session_state.active_tab = 0
+# Previews kept in the static folder; the least recently used ones are removed beyond this
+STATIC_MAX_FILES = 500
 
-# Custom CSS
-st.markdown("""
+# Content digest of each image shown through the static folder, computed once per
+# (cached, shared) image object: id(image) -> (weak reference, digest)
+_static_image_digests = {}
+
+# Display panels are at most ~800 px wide; larger images are downscaled before encoding
+PREVIEW_MAX_SIZE = (800, 800)
+
+# Approximate width of one image gallery (half of the wide layout); only used to size
+# the thumbnails (at 2x the cell width), which are still displayed at the column width
+GALLERY_WIDTH_PX = 640
+
+# Columns exported for each quantile grid
+GRID_EXPORT_COLUMNS = {
+    'lc': ['RESP_FINAL', 'VIDEOS', 'XSHADE_S', 'L', 'C', 'h', 'L_bin', 'C_bin'],
+    'lh': ['RESP_FINAL', 'VIDEOS', 'XSHADE_S', 'L', 'C', 'h', 'L_bin_h', 'h_bin'],
+}
+
+CUSTOM_CSS = """
 <style>
     .main-header {
         font-size: 2.5rem;
@@ -68,6 +85,12 @@ st.markdown("""
         border-radius: 5px;
         margin: 5px 0;
     }
+    .image-caption {
+        color: rgba(49, 51, 63, 0.6);
+        font-size: 14px;
+        text-align: center;
+        margin-top: 0.25rem;
+    }
     .stTabs [data-baseweb="tab-list"] {
         gap: 24px;
     }
@@ -83,717 +106,1026 @@ st.markdown("""
         color: white;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
 
-# Main header
-st.markdown('<h1 class="main-header">L\'Oréal Hair Color Analysis</h1>', unsafe_allow_html=True)
+# ═══════════════════════════════════════════════════════════════════════════════
+# Cached loaders (keyed on scalar ids so reruns skip GCS I/O and decoding)
+# ═══════════════════════════════════════════════════════════════════════════════
 
-# Create tabs with callback to track active tab
-tab1, tab2 = st.tabs(["🎨 Color Remapping", "📊 Quantile Grid Analysis"])
+class _TransientLoadError(Exception):
+    """Raised out of a cached loader after a transient failure, so the partial result is not cached"""
 
-# Detect which tab is being viewed using a hidden radio button trick
-tab_selection = st.radio(
-    "Select Tab",
-    options=["Color Remapping", "Quantile Grid Analysis"],
-    index=st.session_state.active_tab,
-    key="tab_selector",
-    label_visibility="collapsed"
-)
+    def __init__(self, result):
+        super().__init__("transient load failure")
+        self.result = result
 
-# Update session state based on tab selection
-if tab_selection == "Color Remapping":
-    st.session_state.active_tab = 0
-else:
-    st.session_state.active_tab = 1
+# The cached loaders below keep "not found" results (a missing or malformed blob gives
+# an empty DataFrame or None), while GCS and network errors are raised and so not cached
 
-# ═══════════════════════════════════════════════════════════════════════════════
-# TAB 1: Original Color Remapping Feature
-# ═══════════════════════════════════════════════════════════════════════════════
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def _load_respondent_data(respondent_id: str, shade: str) -> pd.DataFrame:
+    """Cached color data for a respondent/shade pair"""
+    return load_respondent_data(respondent_id, shade, raise_errors=True)
 
-with tab1:
-    if st.session_state.active_tab == 0:  # Only execute if this tab is active
-        # Sidebar for controls
-        with st.sidebar:
-            st.header("Controls - Color Remapping")
-            
-            # Respondent ID input
-            respondent_id = st.text_input(
-                "Respondent ID (4 digits)",
-                value="1001",
-                max_chars=4,
-                help="Enter a 4-digit respondent ID. First digit indicates the city.",
-                key="remap_resp_id"
+# PIL images are cached as shared resources: cache_data would pickle and copy the
+# full pixel buffer on every hit. Callers must treat them as read-only.
+@st.cache_resource(ttl=3600, max_entries=32, show_spinner=False)
+def _load_respondent_image(respondent_id: str, shade: str):
+    """Cached (shared, read-only) original image for a respondent/shade pair"""
+    return load_respondent_image(respondent_id, shade, raise_errors=True)
+
+@st.cache_resource(ttl=3600, max_entries=32, show_spinner=False)
+def _load_respondent_mask(respondent_id: str, shade: str):
+    """
+    Cached (shared, read-only) hair mask for a respondent/shade pair
+
+    Returns:
+        tuple: (PIL mask, boolean hair-pixel array) or (None, None) if not found
+    """
+    mask = load_respondent_mask(respondent_id, shade, raise_errors=True)
+    if mask is None:
+        return None, None
+    from src.color_processing import mask_to_bool
+    return mask, mask_to_bool(mask)
+
+def _load_respondent_assets(respondent_id: str, shade: str):
+    """
+    Load color data, image and mask for a respondent/shade pair (shared, read-only)
+
+    Missing blobs are cached like any other result; after a transient failure the
+    parts that did load are returned without caching the bundle, so the next rerun
+    retries only what failed.
+    """
+    try:
+        return _fetch_respondent_assets(respondent_id, shade)
+    except _TransientLoadError as e:
+        return e.result
+
+@st.cache_resource(ttl=3600, max_entries=32, show_spinner="Loading hair color data, image, and mask...")
+def _fetch_respondent_assets(respondent_id: str, shade: str):
+    """
+    Color data, image and mask for a respondent/shade pair, cached as one bundle
+
+    Cached as one bundle so a rerun is a single cache hit; the TTL matches the
+    color data loader. The three loads are independent GCS reads, so cache
+    misses are fetched concurrently; worker threads share the script context
+    so the cached functions behave as if called from the script thread.
+    """
+    with ThreadPoolExecutor(max_workers=3, initializer=add_script_run_ctx,
+                            initargs=(None, get_script_run_ctx())) as executor:
+        futures = (
+            (executor.submit(_load_respondent_data, respondent_id, shade), pd.DataFrame()),
+            (executor.submit(_load_respondent_image, respondent_id, shade), None),
+            (executor.submit(_load_respondent_mask, respondent_id, shade), (None, None)),
+        )
+        parts = []
+        failed = False
+        for future, fallback in futures:
+            try:
+                parts.append(future.result())
+            except Exception:
+                # Already logged by the loader; keep the other parts for this rerun
+                parts.append(fallback)
+                failed = True
+    
+    df, image, (mask, _) = parts
+    if failed:
+        raise _TransientLoadError((df, image, mask))
+    return df, image, mask
+
+# Caches derived from the respondent data share its ttl, so they expire together
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def _get_samples_info(respondent_id: str, shade: str, _df: pd.DataFrame):
+    """
+    Sample selection info for a respondent/shade pair
+
+    Returns:
+        tuple: (samples_info list, selectbox labels, index of the best balanced sample)
+    """
+    from src.color_processing import get_sample_info
+    samples_info = get_sample_info(_df)
+    sample_options = [
+        "Sample {}: {:.1f}% | {:.1f}% | {:.1f}% (Score: {:.1f})".format(
+            i + 1, *sample['proportions'], sample['balance_score']
+        )
+        for i, sample in enumerate(samples_info)
+    ]
+    # Position (not DataFrame label) of the lowest balance score, matching the selectbox options
+    balance_scores = np.fromiter((sample['balance_score'] for sample in samples_info), dtype=float, count=len(samples_info))
+    best_index = int(balance_scores.argmin()) if len(balance_scores) else None
+    return samples_info, sample_options, best_index
+
+def _load_swatch(respondent_id: str, shade: str, df: pd.DataFrame):
+    """
+    Shade ID and swatch for a respondent/shade pair (shared, read-only)
+
+    A swatch that does not exist is cached like a found one. After a GCS/network
+    error the lookup is returned without a swatch and without caching it, so the
+    next rerun tries again.
+
+    Returns:
+        tuple: (shade_id, PIL.Image, swatch_info_dict); image and info are None when
+        no swatch is found, and all three are None when no shade ID is in the data
+    """
+    try:
+        return _fetch_swatch(respondent_id, shade, df)
+    except _TransientLoadError as e:
+        return e.result
+
+@st.cache_resource(ttl=3600, max_entries=64, show_spinner=False)
+def _fetch_swatch(respondent_id: str, shade: str, _df: pd.DataFrame):
+    """Cached (shared, read-only) shade ID and swatch for a respondent/shade pair"""
+    from src.swatch_loader import extract_shade_id_from_data, load_swatch_for_respondent_and_shade
+    shade_id = extract_shade_id_from_data(_df)
+    if not shade_id:
+        return None, None, None
+    # Two-step mapping: respondent -> category, (shade, category) -> swatch
+    try:
+        swatch_image, swatch_info = load_swatch_for_respondent_and_shade(respondent_id, shade_id, raise_errors=True)
+    except Exception:
+        # Already logged by the loader
+        raise _TransientLoadError((shade_id, None, None))
+    return shade_id, swatch_image, swatch_info
+
+@st.cache_resource(ttl=3600, max_entries=64, show_spinner=False)
+def _get_color_bars(respondent_id: str, shade: str, _df: pd.DataFrame):
+    """Color distribution figure for a respondent/shade pair (shared, not pickled)"""
+    from src.color_viz import create_color_bars
+    return create_color_bars(_df)
+
+@st.cache_resource(ttl=3600, max_entries=8, show_spinner=False)
+def _remap_sample(respondent_id: str, shade: str, sample_index: int):
+    """
+    Remap hair colors for one sample, keyed on (respondent, shade, sample_index)
+
+    Inputs come from the cached loaders, so only the scalar key is hashed and the
+    image, boolean hair mask and DataFrame are never hashed or pickled. The
+    remapped image is a shared resource like the loaded originals: callers must
+    treat it as read-only.
+    """
+    from src.color_processing import process_hair_color_remapping_with_sample
+    df = _load_respondent_data(respondent_id, shade)
+    image = _load_respondent_image(respondent_id, shade)
+    _, hair_mask = _load_respondent_mask(respondent_id, shade)
+    return process_hair_color_remapping_with_sample(image, hair_mask, df, sample_index)
+
+def _select_sample(sample_index: int):
+    """Button callback: point the sample selectbox at the given sample"""
+    st.session_state.sample_select = sample_index
+
+def _image_digest(image) -> str:
+    """Short content digest of a PIL image, memoized per image object"""
+    key = id(image)
+    entry = _static_image_digests.get(key)
+    if entry is not None and entry[0]() is image:
+        return entry[1]
+    
+    hasher = hashlib.blake2b(f"{image.mode}:{image.size}:".encode(), digest_size=8)
+    hasher.update(image.tobytes())
+    digest = hasher.hexdigest()
+    _static_image_digests[key] = (weakref.ref(image, lambda _, key=key: _static_image_digests.pop(key, None)), digest)
+    return digest
+
+def _safe_filename(name: str) -> str:
+    """Single path component made of safe characters only"""
+    return re.sub(r'[^A-Za-z0-9._-]', '_', os.path.basename(str(name)))
+
+def _static_image_url(image, filename: str, max_size: tuple = PREVIEW_MAX_SIZE) -> str:
+    """
+    Write a downscaled preview of a PIL image into the static folder once and return its served URL
+
+    The file name carries a digest of the image content (and preview size), so a
+    changed image gets a new file instead of a stale one, while reruns reuse the
+    file on disk and the browser can cache the URL instead of re-receiving pixels.
+    The full-resolution image is left untouched for processing.
+    """
+    stem, ext = os.path.splitext(_safe_filename(filename))
+    filename = f"{stem}_{_image_digest(image)}_{max_size[0]}x{max_size[1]}{ext}"
+    path = os.path.join(STATIC_DIR, filename)
+    if os.path.exists(path):
+        # Mark the preview as recently used, so pruning removes other files first
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+    else:
+        os.makedirs(STATIC_DIR, exist_ok=True)
+        preview = image
+        if image.width > max_size[0] or image.height > max_size[1]:
+            preview = image.copy()
+            preview.thumbnail(max_size, Image.Resampling.BILINEAR)
+        # Unique temp file per writer: sessions are threads of one process
+        fd, tmp_path = tempfile.mkstemp(dir=STATIC_DIR, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                preview.save(tmp_file, format="PNG", optimize=False, compress_level=1)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        _prune_static_dir()
+    return f"app/static/{filename}"
+
+def _prune_static_dir(max_files: int = STATIC_MAX_FILES):
+    """Remove the least recently used previews once the static folder holds more than max_files"""
+    previews = []
+    for entry in os.scandir(STATIC_DIR):
+        # Temp files belong to writers in other sessions
+        if entry.name.endswith(".tmp"):
+            continue
+        try:
+            previews.append((entry.stat().st_mtime, entry.path))
+        except OSError:
+            continue
+    
+    if len(previews) <= max_files:
+        return
+    
+    previews.sort()
+    for _, preview_path in previews[:len(previews) - max_files]:
+        try:
+            os.remove(preview_path)
+        except OSError:
+            pass
+
+def _show_static_image(image, filename: str, caption: str, width: int = None):
+    """Render a PIL image through the static file server with a caption"""
+    url = _static_image_url(image, filename)
+    size_style = f"width: {width}px;" if width else "width: 100%;"
+    st.markdown(
+        f'<img src="{url}" style="{size_style}" alt="{html.escape(caption)}"/>'
+        f'<p class="image-caption">{html.escape(caption)}</p>',
+        unsafe_allow_html=True
+    )
+
+def _upload_key(raw: bytes) -> str:
+    """Content digest of an uploaded file, hashed once and used as the cache key"""
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+# The upload helpers below are keyed on the upload digest; the bytes and parsed
+# frame are passed unhashed (leading underscore) so they are not rehashed per call
+@st.cache_data(max_entries=8, show_spinner=False)
+def _parse_uploaded_csv(upload_key: str, _raw: bytes) -> pd.DataFrame:
+    """Parse an uploaded analysis CSV, keyed on its content digest"""
+    # Pick the separator from the header line so the file is parsed only once
+    header = _raw.split(b"\n", 1)[0]
+    sep = ';' if header.count(b';') > header.count(b',') else ','
+    return pd.read_csv(io.BytesIO(_raw), sep=sep)
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _get_available_regions(upload_key: str, _df: pd.DataFrame) -> list:
+    """Sorted color regions of an uploaded analysis CSV"""
+    return sorted(_df['color_regions'].unique())
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _filter_region(upload_key: str, region, _df: pd.DataFrame) -> pd.DataFrame:
+    """Rows of an uploaded analysis CSV belonging to one color region"""
+    return _df[_df['color_regions'] == region]
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _select_quantile_samples(upload_key: str, region, color_type: str, grid_size: int, _df: pd.DataFrame) -> dict:
+    """Quantile-based representative samples for one region, color type and grid size"""
+    from src.quantile_analysis import select_representative_samples_quantile
+    return select_representative_samples_quantile(
+        _filter_region(upload_key, region, _df),
+        region,
+        color_type=color_type,
+        grid_size=grid_size
+    )
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def _get_grid_figure(upload_key: str, region, color_type: str, grid_size: int, _df: pd.DataFrame):
+    """Quantile grid figure with respondent images (shared, not pickled); built once per selection"""
+    from src.quantile_viz import create_grid_visualization_with_images
+    return create_grid_visualization_with_images(
+        _select_quantile_samples(upload_key, region, color_type, grid_size, _df),
+        region,
+        color_type=color_type
+    )
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _get_grid_csv(upload_key: str, region, color_type: str, grid_size: int, grid: str, _df: pd.DataFrame) -> bytes:
+    """CSV export of one quantile grid ('lc' or 'lh'), encoded once per selection"""
+    samples = _select_quantile_samples(upload_key, region, color_type, grid_size, _df)[f'{grid}_samples']
+    return samples[GRID_EXPORT_COLUMNS[grid]].to_csv(index=False).encode()
+
+@st.cache_data(show_spinner=False)
+def _get_city_table() -> pd.DataFrame:
+    """City code reference table for the welcome screen"""
+    return pd.DataFrame({"Code": list(CITY_NAMES.keys()), "City": list(CITY_NAMES.values())})
+
+def _get_available_shades(respondent_id: str) -> list:
+    """
+    Available shades for a respondent
+
+    A missing or malformed CSV gives an empty list, which is cached for the same
+    hour as the CSV itself. A GCS/network error gives an empty list for this rerun
+    only, so the next rerun asks again.
+    """
+    try:
+        return _fetch_available_shades(respondent_id)
+    except Exception:
+        return []
+
+@st.cache_data(ttl=3600, max_entries=128, show_spinner=False)
+def _fetch_available_shades(respondent_id: str) -> list:
+    """Cached list of available shades for a respondent (GCS/network errors are raised, not cached)"""
+    return get_available_shades(respondent_id, raise_errors=True)
+
+# Mapping lookups are read-only reference data: cache_resource shares one object
+# across sessions instead of pickling a copy on every hit like cache_data
+@st.cache_resource(max_entries=256, show_spinner=False)
+def _get_respondent_info(respondent_id: str) -> dict:
+    """Cached (shared, read-only) hair category / skin tone info for a respondent"""
+    from src.swatch_loader import get_respondent_info
+    return get_respondent_info(respondent_id)
+
+@st.cache_resource(show_spinner=False)
+def _get_mapping_info() -> dict:
+    """Cached (shared, read-only) summary of the local mapping files"""
+    from src.swatch_loader import get_mapping_info
+    return get_mapping_info()
+
+@st.fragment
+def _render_remap_panel(respondent_id: str, selected_shade: str, df: pd.DataFrame, image, mask,
+                        samples_info: list, sample_options: list, best_sample_index: int):
+    """
+    Sample selection, original/remapped images and detailed data for tab 1
+
+    Runs as a fragment: changing the sample only reruns this panel, not the
+    sidebar, asset loading and metrics above it.
+    """
+    # Sample selection section
+    st.subheader("🎨 Choose Sample for Color Remapping")
+    
+    col_select1, col_select2 = st.columns([2, 1])
+    
+    with col_select1:
+        selected_sample_index = st.selectbox(
+            "Select which sample to use for color remapping:",
+            options=range(len(samples_info)),
+            format_func=lambda x: sample_options[x],
+            help="Choose the sample with color proportions you prefer for remapping",
+            key="sample_select"
+        )
+    
+    with col_select2:
+        # Sample with the lowest balance score (precomputed with samples_info);
+        # the callback sets the selectbox state before the rerun, so no st.rerun() is needed
+        st.button(
+            "🔄 Use Best Balanced",
+            help="Select the most balanced sample (closest to 33% each)",
+            key="best_balanced",
+            on_click=_select_sample,
+            args=(best_sample_index,)
+        )
+    
+    # Show selected sample details
+    if selected_sample_index is not None:
+        selected_sample = samples_info[selected_sample_index]
+        
+        st.markdown('<div class="sample-info">', unsafe_allow_html=True)
+        col_detail1, col_detail2, col_detail3 = st.columns(3)
+        
+        with col_detail1:
+            st.markdown(
+                f"**Selected:** Sample {selected_sample_index + 1}  \n"
+                f"**File:** {selected_sample['filename']}"
             )
+        
+        with col_detail2:
+            proportions = selected_sample['proportions']
+            st.markdown(
+                f"**Color 1:** {proportions[0]:.1f}%  \n"
+                f"**Color 2:** {proportions[1]:.1f}%  \n"
+                f"**Color 3:** {proportions[2]:.1f}%"
+            )
+        
+        with col_detail3:
+            balance_quality = "Excellent" if selected_sample['balance_score'] < 10 else "Good" if selected_sample['balance_score'] < 20 else "Fair"
+            st.markdown(
+                f"**Balance Score:** {selected_sample['balance_score']:.1f}  \n"
+                f"**Quality:** {balance_quality}"
+            )
+        
+        st.markdown('</div>', unsafe_allow_html=True)
+    
+    st.divider()
+    
+    # Main content in 3 columns
+    col1, col2, col3 = st.columns([1, 1.5, 1])
+    
+    with col1:
+        st.subheader("Original Image")
+        
+        if image:
+            st.markdown('<div class="image-container">', unsafe_allow_html=True)
+            _show_static_image(
+                image,
+                f"{respondent_id}_{selected_shade}_original.png",
+                caption=f"Original - {respondent_id} - {selected_shade}"
+            )
+            st.markdown('</div>', unsafe_allow_html=True)
             
-            # Validate respondent ID
-            if respondent_id and len(respondent_id) == 4:
+            # Image info
+            st.markdown(
+                f"**Size:** {image.size[0]} x {image.size[1]} px  \n"
+                f"**Format:** {image.format}"
+            )
+        else:
+            st.error("Original image not found")
+            expected_path = build_image_path(respondent_id, selected_shade)
+            st.code(expected_path, language="text")
+    
+    with col2:
+        st.subheader("Color Distribution")
+        
+        # Create and display the color bars
+        fig = _get_color_bars(respondent_id, selected_shade, df)
+        st.plotly_chart(fig, use_container_width=True)
+        
+        # Show sample files
+        if 'filename' in df.columns:
+            with st.expander("All Sample Files"):
+                sample_files = pd.DataFrame({
+                    'Sample': [f"Sample {i+1}" for i in range(len(df))],
+                    'File': df['filename'].to_numpy(),
+                    'Status': np.where(np.arange(len(df)) == selected_sample_index, "🎯 SELECTED", "")
+                })
+                # At most 5 rows (load_respondent_data caps the samples): a static table is enough
+                st.table(sample_files.set_index('Sample'))
+    
+    with col3:
+        st.subheader("Remapped Colors")
+        
+        # The last failure is remembered for the current (respondent, shade, sample) only,
+        # so reruns show it instead of retrying, while changing the selection (or
+        # reloading the mappings) drops it and the remap is tried again. GCS/network
+        # errors are not remembered, so the next rerun retries them
+        remap_key = (respondent_id, selected_shade, selected_sample_index)
+        remap_error = st.session_state.get('remap_error')
+        if remap_error is not None and remap_error[0] != remap_key:
+            del st.session_state['remap_error']
+            remap_error = None
+        
+        if image and mask and selected_sample_index is not None and remap_error is not None:
+            st.error(f"Error in color remapping: {remap_error[1]}")
+        
+        elif image and mask and selected_sample_index is not None:
+            with st.spinner(f"Processing color remapping with Sample {selected_sample_index + 1}..."):
                 try:
-                    city_code = int(respondent_id[0])
-                    if city_code in CITY_FOLDERS:
-                        city_name = CITY_FOLDERS[city_code].replace("mcb_hair_bucket_", "").title()
-                        st.success(f"City: {city_name}")
-                        
-                        # Get available shades
-                        available_shades = get_available_shades(respondent_id)
-                        
-                        if available_shades:
-                            selected_shade = st.selectbox(
-                                "Select Shade",
-                                options=available_shades,
-                                help="Choose a hair shade for analysis",
-                                key="remap_shade"
-                            )
-                        else:
-                            st.error("No shades found for this respondent ID")
-                            selected_shade = None
-                    else:
-                        st.error("Invalid city code (must be 1-7)")
-                        selected_shade = None
-                except ValueError:
-                    st.error("Invalid respondent ID format")
-                    selected_shade = None
-            else:
-                st.warning("Please enter a 4-digit respondent ID")
-                selected_shade = None
-            
-            # Debug section for mapping
-            st.divider()
-            st.subheader("Debug Info")
-            if st.button("Check Mapping Files", key="check_mapping"):
-                mapping_info = get_mapping_info()
-                
-                # Shades mapping info
-                shades_info = mapping_info['shades_mapping']
-                if shades_info['file_exists']:
-                    st.success(f"✅ Shades mapping: {shades_info['total_entries']} entries")
-                    if shades_info['sample_entries']:
-                        st.write("Sample shades:")
-                        for entry in shades_info['sample_entries']:
-                            st.write(f"• {entry['name'][:30]}...")
-                            st.write(f"  L:{entry['light']} M:{entry['medium']} D:{entry['dark']}")
-                else:
-                    st.error(f"❌ Shades mapping not found")
-                
-                # Hair category info
-                category_info = mapping_info['hair_category']
-                if category_info['file_exists']:
-                    st.success(f"✅ Hair category: {category_info['total_entries']} entries")
-                    if category_info['sample_entries']:
-                        st.write("Sample categories:")
-                        for entry in category_info['sample_entries']:
-                            st.write(f"• {entry['respondent_id']} → {entry['category']}")
-                else:
-                    st.error(f"❌ Hair category not found")
-            
-            if st.button("Reload Mappings", key="reload_mapping"):
-                shades_count, category_count = reload_mappings()
-                st.success(f"Mappings reloaded! Shades: {shades_count}, Categories: {category_count}")
-
-        # Main content
-        if respondent_id and selected_shade:
-            # Load data, image, and mask
-            with st.spinner("Loading hair color data, image, and mask..."):
-                df = load_respondent_data(respondent_id, selected_shade)
-                image = load_respondent_image(respondent_id, selected_shade)
-                mask = load_respondent_mask(respondent_id, selected_shade)
-            
-            if not df.empty:
-                # Get sample information for selection
-                samples_info = get_sample_info(df)
-                
-                respondent_info = get_respondent_info(respondent_id)
-                # Display main metrics
-                col_info1, col_info2, col_info3, col_info4, col_info5, col_info6 = st.columns(6)
-                
-                with col_info1:
-                    st.metric("Respondent ID", respondent_id)
-                with col_info2:
-                    st.metric("Selected Shade", selected_shade)
-                with col_info3:
-                    st.metric("Samples Found", len(df))
-                with col_info4:
-                    city_name = CITY_FOLDERS[int(respondent_id[0])].replace("mcb_hair_bucket_", "").title()
-                    st.metric("City", city_name)
-                with col_info5:
-                    hair_tone = respondent_info['hair_tone'] if respondent_info['hair_tone'] else "Unknown"
-                    st.metric("Hair Tone", hair_tone)
-                with col_info6:
-                    skin_tone = respondent_info['skin_tone_cluster'] if respondent_info['skin_tone_cluster'] else "Unknown"
-                    st.metric("Skin Tone Cluster", skin_tone)
-                
-                st.divider()
-                
-                # Sample selection section
-                st.subheader("🎨 Choose Sample for Color Remapping")
-                
-                # Create options for selectbox with detailed info
-                sample_options = []
-                for i, sample in enumerate(samples_info):
-                    proportions_str = f"{sample['proportions'][0]:.1f}% | {sample['proportions'][1]:.1f}% | {sample['proportions'][2]:.1f}%"
-                    option_text = f"Sample {i+1}: {proportions_str} (Score: {sample['balance_score']:.1f})"
-                    sample_options.append(option_text)
-                
-                col_select1, col_select2 = st.columns([2, 1])
-                
-                with col_select1:
-                    selected_sample_index = st.selectbox(
-                        "Select which sample to use for color remapping:",
-                        options=range(len(samples_info)),
-                        format_func=lambda x: sample_options[x],
-                        help="Choose the sample with color proportions you prefer for remapping",
-                        key="sample_select"
-                    )
-                
-                with col_select2:
-                    if st.button("🔄 Use Best Balanced", help="Select the most balanced sample (closest to 33% each)", key="best_balanced"):
-                        # Find the sample with the lowest balance score
-                        best_sample = min(samples_info, key=lambda x: x['balance_score'])
-                        selected_sample_index = best_sample['index']
-                        st.rerun()
-                
-                # Show selected sample details
-                if selected_sample_index is not None:
-                    selected_sample = samples_info[selected_sample_index]
+                    remapped_image = _remap_sample(respondent_id, selected_shade, selected_sample_index)
                     
-                    st.markdown('<div class="sample-info">', unsafe_allow_html=True)
-                    col_detail1, col_detail2, col_detail3 = st.columns(3)
-                    
-                    with col_detail1:
-                        st.write(f"**Selected:** Sample {selected_sample_index + 1}")
-                        st.write(f"**File:** {selected_sample['filename']}")
+                    st.markdown('<div class="remapped-container">', unsafe_allow_html=True)
+                    _show_static_image(
+                        remapped_image,
+                        f"{respondent_id}_{selected_shade}_{selected_sample_index}_remapped.png",
+                        caption=f"Remapped - Sample {selected_sample_index + 1} - {selected_shade}"
+                    )
+                    st.markdown('</div>', unsafe_allow_html=True)
                     
-                    with col_detail2:
-                        proportions = selected_sample['proportions']
-                        st.write(f"**Color 1:** {proportions[0]:.1f}%")
-                        st.write(f"**Color 2:** {proportions[1]:.1f}%")
-                        st.write(f"**Color 3:** {proportions[2]:.1f}%")
+                    st.success(f"✨ Remapped with Sample {selected_sample_index + 1}!")
                     
-                    with col_detail3:
-                        st.write(f"**Balance Score:** {selected_sample['balance_score']:.1f}")
-                        balance_quality = "Excellent" if selected_sample['balance_score'] < 10 else "Good" if selected_sample['balance_score'] < 20 else "Fair"
-                        st.write(f"**Quality:** {balance_quality}")
+                except Exception as e:
+                    logger.error(f"Color remapping failed for {remap_key}: {e}")
+                    if not isinstance(e, TRANSIENT_GCS_ERRORS):
+                        st.session_state['remap_error'] = (remap_key, str(e))
+                    st.error(f"Error in color remapping: {str(e)}")
                     
-                    st.markdown('</div>', unsafe_allow_html=True)
-                
-                st.divider()
-                
-                # Main content in 3 columns
-                col1, col2, col3 = st.columns([1, 1.5, 1])
+        elif not mask:
+            st.error("Mask not found")
+            expected_mask_path = build_mask_path(respondent_id, selected_shade)
+            st.code(expected_mask_path, language="text")
+        elif not image:
+            st.warning("Original image required for remapping")
+        else:
+            st.info("Select a sample above to see remapped result")
+    
+    # Detailed data table and swatch (full width)
+    with st.expander("View Detailed Color Data"):
+        # Highlight selected sample in dataframe
+        # Append the marker column without deep-copying the cached frame
+        styled_df = df
+        if selected_sample_index is not None:
+            selected_col = pd.Series(
+                np.where(np.arange(len(df)) == selected_sample_index, '🎯 YES', ''),
+                index=df.index, name='Selected'
+            )
+            styled_df = pd.concat([df, selected_col], axis=1, copy=False)
+        
+        st.dataframe(styled_df, use_container_width=True)
+        
+        # Load and display swatch
+        st.subheader("Color Swatch Reference")
+        
+        with st.spinner("Loading color swatch..."):
+            # Extract shade ID from data and resolve the swatch (cached per respondent/shade)
+            shade_id, swatch_image, swatch_info = _load_swatch(respondent_id, selected_shade, df)
+            
+            if shade_id:
+                st.info(f"Looking for swatch - Respondent: **{respondent_id}**, Shade ID: **{shade_id}**")
                 
-                with col1:
-                    st.subheader("Original Image")
+                if swatch_image and swatch_info:
+                    col_swatch1, col_swatch2 = st.columns([1, 2])
                     
-                    if image:
-                        st.markdown('<div class="image-container">', unsafe_allow_html=True)
-                        st.image(
-                            image, 
-                            caption=f"Original - {respondent_id} - {selected_shade}",
-                            use_container_width=True
+                    with col_swatch1:
+                        st.markdown('<div class="swatch-container">', unsafe_allow_html=True)
+                        _show_static_image(
+                            swatch_image,
+                            f"swatch_{swatch_info['category']}_{swatch_info['swatch_id']}.png",
+                            caption=f"Swatch: {swatch_info['name']}",
+                            width=200
                         )
                         st.markdown('</div>', unsafe_allow_html=True)
-                        
-                        # Image info
-                        st.write(f"**Size:** {image.size[0]} x {image.size[1]} px")
-                        st.write(f"**Format:** {image.format}")
-                    else:
-                        st.error("Original image not found")
-                        expected_path = build_image_path(respondent_id, selected_shade)
-                        st.code(expected_path, language="text")
-                
-                with col2:
-                    st.subheader("Color Distribution")
-                    
-                    # Create and display the color bars
-                    fig = create_color_bars(df)
-                    st.plotly_chart(fig, use_container_width=True)
                     
-                    # Show sample files
-                    if 'filename' in df.columns:
-                        with st.expander("All Sample Files"):
-                            for idx, filename in enumerate(df['filename']):
-                                is_selected = idx == selected_sample_index
-                                status = "🎯 SELECTED" if is_selected else ""
-                                st.write(f"**Sample {idx+1}:** {filename} {status}")
-                
-                with col3:
-                    st.subheader("Remapped Colors")
-                    
-                    if image and mask and selected_sample_index is not None:
-                        with st.spinner(f"Processing color remapping with Sample {selected_sample_index + 1}..."):
-                            try:
-                                remapped_image = process_hair_color_remapping_with_sample(
-                                    image, mask, df, selected_sample_index
-                                )
-                                
-                                st.markdown('<div class="remapped-container">', unsafe_allow_html=True)
-                                st.image(
-                                    remapped_image,
-                                    caption=f"Remapped - Sample {selected_sample_index + 1} - {selected_shade}",
-                                    use_container_width=True
-                                )
-                                st.markdown('</div>', unsafe_allow_html=True)
-                                
-                                st.success(f"✨ Remapped with Sample {selected_sample_index + 1}!")
-                                
-                            except Exception as e:
-                                st.error(f"Error in color remapping: {str(e)}")
-                                
-                    elif not mask:
-                        st.error("Mask not found")
-                        expected_mask_path = build_mask_path(respondent_id, selected_shade)
-                        st.code(expected_mask_path, language="text")
-                    elif not image:
-                        st.warning("Original image required for remapping")
-                    else:
-                        st.info("Select a sample above to see remapped result")
-                
-                # Detailed data table and swatch (full width)
-                with st.expander("View Detailed Color Data"):
-                    # Highlight selected sample in dataframe
-                    styled_df = df.copy()
-                    if selected_sample_index is not None:
-                        # Add a column to show which sample is selected
-                        styled_df['Selected'] = ['🎯 YES' if i == selected_sample_index else '' for i in range(len(styled_df))]
-                    
-                    st.dataframe(styled_df, use_container_width=True)
-                    
-                    # Load and display swatch
-                    st.subheader("Color Swatch Reference")
-                    
-                    with st.spinner("Loading color swatch..."):
-                        # Extract shade ID from data
-                        shade_id = extract_shade_id_from_data(df)
+                    with col_swatch2:
+                        st.markdown(
+                            "**Swatch Information:**  \n"
+                            f"**Name:** {swatch_info['name']}  \n"
+                            f"**Category:** {swatch_info['mapping_category'].title()}  \n"
+                            f"**Filename:** {swatch_info['filename']}  \n"
+                            f"**Folder:** {swatch_info['folder']}  \n"
+                            f"**Path:** `{swatch_info['path']}`"
+                        )
                         
-                        if shade_id:
-                            st.info(f"Looking for swatch - Respondent: **{respondent_id}**, Shade ID: **{shade_id}**")
-                            
-                            # Use the new two-step mapping process
-                            swatch_image, swatch_info = load_swatch_for_respondent_and_shade(respondent_id, shade_id)
-                            
-                            if swatch_image and swatch_info:
-                                col_swatch1, col_swatch2 = st.columns([1, 2])
-                                
-                                with col_swatch1:
-                                    st.markdown('<div class="swatch-container">', unsafe_allow_html=True)
-                                    st.image(
-                                        swatch_image,
-                                        caption=f"Swatch: {swatch_info['name']}",
-                                        width=200
-                                    )
-                                    st.markdown('</div>', unsafe_allow_html=True)
-                                
-                                with col_swatch2:
-                                    st.write("**Swatch Information:**")
-                                    st.write(f"**Name:** {swatch_info['name']}")
-                                    st.write(f"**Category:** {swatch_info['mapping_category'].title()}")
-                                    st.write(f"**Filename:** {swatch_info['filename']}")
-                                    st.write(f"**Folder:** {swatch_info['folder']}")
-                                    st.write(f"**Path:** `{swatch_info['path']}`")
-                                    
-                            else:
-                                st.warning(f"No swatch found for Respondent {respondent_id}, Shade ID: {shade_id}")
-                                st.info("Check the mapping files in Debug Info section")
-                        else:
-                            st.warning("Could not extract shade ID from data for swatch lookup")
-                            st.info("Available columns in data:")
-                            st.write(df.columns.tolist())
-                    
+                else:
+                    st.warning(f"No swatch found for Respondent {respondent_id}, Shade ID: {shade_id}")
+                    st.info("Check the mapping files in Debug Info section")
             else:
-                st.error(f"No data found for Respondent {respondent_id} with shade '{selected_shade}'")
+                st.warning("Could not extract shade ID from data for swatch lookup")
+                st.info("Available columns in data:")
+                st.write(df.columns.tolist())
 
-        else:
-            # Welcome message
-            st.info("👆 Please select a Respondent ID and Shade from the sidebar to begin analysis.")
+def _render_image_gallery(title: str, samples_grid: dict, grid_size: int, cell_px: int,
+                          caption_fmt: str, empty_message: str):
+    """
+    Render grid-cell indexed respondent images as a grid_size x grid_size gallery
+
+    caption_fmt is formatted with the image info dict (respondent_id, shade, L, C, h).
+    """
+    from src.quantile_viz import gallery_thumbnail_size, load_grid_images_for_gallery
+    
+    st.markdown(f"##### {title}")
+    
+    # Images come pre-indexed by grid cell from the quantile selector
+    images_by_cell = load_grid_images_for_gallery(samples_grid, size=gallery_thumbnail_size(cell_px))
+    
+    if not images_by_cell:
+        st.warning(empty_message)
+        return
+    
+    # Create proper grid with correct positions
+    for row_idx in range(grid_size):
+        cols = st.columns(grid_size)
+        for col_idx in range(grid_size):
+            # Find image that belongs in this grid position
+            matching_img = images_by_cell.get((row_idx, col_idx))
             
-            # Show city mapping
-            st.subheader("City Codes")
-            city_df = pd.DataFrame([
-                {"Code": k, "City": v.replace("mcb_hair_bucket_", "").title()} 
-                for k, v in CITY_FOLDERS.items()
-            ])
-            st.table(city_df)
-    else:
-        st.info("👈 Switch to this tab to use Color Remapping features")
+            with cols[col_idx]:
+                if matching_img:
+                    st.image(
+                        matching_img['image'],
+                        caption=caption_fmt.format(**matching_img),
+                        use_container_width=True
+                    )
+                else:
+                    # Empty cell - show placeholder
+                    st.write("")
+
+# Page configuration
+st.set_page_config(
+    page_title="L'Oréal Hair Color Analysis",
+    page_icon="💇‍♀️",
+    layout="wide",
+    initial_sidebar_state="expanded"
+)
+
+# Custom CSS
+st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
+
+# Main header
+st.markdown('<h1 class="main-header">L\'Oréal Hair Color Analysis</h1>', unsafe_allow_html=True)
+
+# Create tabs (heavy work in both tabs is cached, so rendering both on each rerun is cheap)
+tab1, tab2 = st.tabs(["🎨 Color Remapping", "📊 Quantile Grid Analysis"])
 
 # ═══════════════════════════════════════════════════════════════════════════════
-# TAB 2: Quantile Grid Analysis
+# TAB 1: Original Color Remapping Feature
 # ═══════════════════════════════════════════════════════════════════════════════
 
-with tab2:
-    if st.session_state.active_tab == 1:  # Only execute if this tab is active
-        st.header("📊 Quantile-Based Grid Analysis")
-        st.markdown("""
-        This analysis uses quantile-based binning to select representative hair samples across 
-        the L-C (Lightness-Chroma) and L-h (Lightness-Hue) color spaces.
-        """)
+with tab1:
+    # Sidebar for controls
+    with st.sidebar:
+        st.header("Controls - Color Remapping")
         
-        # File upload
-        uploaded_file = st.file_uploader(
-            "Upload CSV file for analysis",
-            type=['csv'],
-            help="Upload a CSV file containing hair color data with RESP_FINAL, VIDEOS, L_main, a_main, b_main, L_reflect, a_reflect, b_reflect columns",
-            key="quantile_csv_upload"
+        # Respondent ID input
+        respondent_id = st.text_input(
+            "Respondent ID (4 digits)",
+            value="1001",
+            max_chars=4,
+            help="Enter a 4-digit respondent ID. First digit indicates the city.",
+            key="remap_resp_id"
         )
         
-        if uploaded_file is not None:
+        # Validate respondent ID
+        if respondent_id and len(respondent_id) == 4:
             try:
-                # Try different separators
-                try:
-                    df_analysis = pd.read_csv(uploaded_file, sep=';')
-                except:
-                    uploaded_file.seek(0)
-                    df_analysis = pd.read_csv(uploaded_file, sep=',')
-                
-                st.success(f"✅ CSV loaded successfully! Total rows: {len(df_analysis)}")
-                
-                # Display file info
-                col_file1, col_file2, col_file3 = st.columns(3)
-                with col_file1:
-                    st.metric("Total Samples", len(df_analysis))
-                with col_file2:
-                    if 'color_regions' in df_analysis.columns:
-                        st.metric("Regions", df_analysis['color_regions'].nunique())
+                # Reject non-numeric IDs before listing shades in GCS
+                if not respondent_id.isdigit():
+                    raise ValueError(respondent_id)
+                city_code = int(respondent_id[0])
+                if city_code in CITY_FOLDERS:
+                    city_name = CITY_NAMES[city_code]
+                    st.success(f"City: {city_name}")
+                    
+                    # Get available shades
+                    available_shades = _get_available_shades(respondent_id)
+                    
+                    if available_shades:
+                        selected_shade = st.selectbox(
+                            "Select Shade",
+                            options=available_shades,
+                            help="Choose a hair shade for analysis",
+                            key="remap_shade"
+                        )
                     else:
-                        st.metric("Regions", "N/A")
-                with col_file3:
-                    st.metric("Columns", len(df_analysis.columns))
-                
-                # Show available columns
-                with st.expander("View Available Columns"):
-                    st.write(df_analysis.columns.tolist())
-                    st.dataframe(df_analysis.head(3))
-                
-                # Check for required columns
-                required_cols = ['RESP_FINAL', 'VIDEOS', 'L_main', 'a_main', 'b_main', 'L_reflect', 'a_reflect', 'b_reflect']
-                missing_cols = [col for col in required_cols if col not in df_analysis.columns]
-                
-                if missing_cols:
-                    st.error(f"❌ Missing required columns: {', '.join(missing_cols)}")
-                    st.info("Required columns: " + ", ".join(required_cols))
+                        st.error("No shades found for this respondent ID")
+                        selected_shade = None
                 else:
-                    # Region selection
-                    if 'color_regions' in df_analysis.columns:
-                        available_regions = sorted(df_analysis['color_regions'].unique())
-                        
-                        col_region1, col_region2 = st.columns([2, 1])
-                        
-                        with col_region1:
-                            selected_region = st.selectbox(
-                                "Select Region to Analyze",
-                                options=available_regions,
-                                help="Choose which color region to analyze",
-                                key="quantile_region"
-                            )
-                        
-                        with col_region2:
-                            grid_size = st.slider(
-                                "Grid Size",
-                                min_value=2,
-                                max_value=6,
-                                value=4,
-                                help="Number of bins per dimension (e.g., 4 = 4x4 grid)",
-                                key="grid_size"
-                            )
+                    st.error("Invalid city code (must be 1-7)")
+                    selected_shade = None
+            except ValueError:
+                st.error("Invalid respondent ID format")
+                selected_shade = None
+        else:
+            st.warning("Please enter a 4-digit respondent ID")
+            selected_shade = None
+        
+        # Debug section for mapping
+        st.divider()
+        st.subheader("Debug Info")
+        if st.button("Check Mapping Files", key="check_mapping"):
+            mapping_info = _get_mapping_info()
+            
+            # Shades mapping info
+            shades_info = mapping_info['shades_mapping']
+            if shades_info['file_exists']:
+                st.success(f"✅ Shades mapping: {shades_info['total_entries']} entries")
+                if shades_info['sample_entries']:
+                    st.markdown("Sample shades:  \n" + "  \n".join(
+                        f"• {entry['name'][:30]}...  \n  L:{entry['light']} M:{entry['medium']} D:{entry['dark']}"
+                        for entry in shades_info['sample_entries']
+                    ))
+            else:
+                st.error(f"❌ Shades mapping not found")
+            
+            # Hair category info
+            category_info = mapping_info['hair_category']
+            if category_info['file_exists']:
+                st.success(f"✅ Hair category: {category_info['total_entries']} entries")
+                if category_info['sample_entries']:
+                    st.markdown("Sample categories:  \n" + "  \n".join(
+                        f"• {entry['respondent_id']} → {entry['category']}"
+                        for entry in category_info['sample_entries']
+                    ))
+            else:
+                st.error(f"❌ Hair category not found")
+        
+        if st.button("Reload Mappings", key="reload_mapping"):
+            from src.swatch_loader import reload_mappings
+            shades_count, category_count = reload_mappings()
+            _get_mapping_info.clear()
+            _get_respondent_info.clear()
+            _fetch_swatch.clear()
+            st.session_state.pop('remap_error', None)
+            st.success(f"Mappings reloaded! Shades: {shades_count}, Categories: {category_count}")
+
+    # Main content
+    if respondent_id and selected_shade:
+        # Load data, image, and mask as one cached bundle (the spinner only shows on a miss)
+        df, image, mask = _load_respondent_assets(respondent_id, selected_shade)
+        
+        if not df.empty:
+            # Get sample information for selection
+            samples_info, sample_options, best_sample_index = _get_samples_info(respondent_id, selected_shade, df)
+            
+            respondent_info = _get_respondent_info(respondent_id)
+            # Display main metrics
+            col_info1, col_info2, col_info3, col_info4, col_info5, col_info6 = st.columns(6)
+            
+            with col_info1:
+                st.metric("Respondent ID", respondent_id)
+            with col_info2:
+                st.metric("Selected Shade", selected_shade)
+            with col_info3:
+                st.metric("Samples Found", len(df))
+            with col_info4:
+                city_name = CITY_NAMES[int(respondent_id[0])]
+                st.metric("City", city_name)
+            with col_info5:
+                hair_tone = respondent_info['hair_tone'] if respondent_info['hair_tone'] else "Unknown"
+                st.metric("Hair Tone", hair_tone)
+            with col_info6:
+                skin_tone = respondent_info['skin_tone_cluster'] if respondent_info['skin_tone_cluster'] else "Unknown"
+                st.metric("Skin Tone Cluster", skin_tone)
+            
+            st.divider()
+            
+            # Sample selection and results (a fragment: sample changes rerun only this panel)
+            _render_remap_panel(
+                respondent_id, selected_shade, df, image, mask,
+                samples_info, sample_options, best_sample_index
+            )
+            
+        else:
+            st.error(f"No data found for Respondent {respondent_id} with shade '{selected_shade}'")
+
+    else:
+        # Welcome message
+        st.info("👆 Please select a Respondent ID and Shade from the sidebar to begin analysis.")
+        
+        # Show city mapping
+        st.subheader("City Codes")
+        st.table(_get_city_table())
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# TAB 2: Quantile Grid Analysis
+# ═══════════════════════════════════════════════════════════════════════════════
+
+with tab2:
+    st.header("📊 Quantile-Based Grid Analysis")
+    st.markdown("""
+    This analysis uses quantile-based binning to select representative hair samples across 
+    the L-C (Lightness-Chroma) and L-h (Lightness-Hue) color spaces.
+    """)
+    
+    # File upload
+    uploaded_file = st.file_uploader(
+        "Upload CSV file for analysis",
+        type=['csv'],
+        help="Upload a CSV file containing hair color data with RESP_FINAL, VIDEOS, L_main, a_main, b_main, L_reflect, a_reflect, b_reflect columns",
+        key="quantile_csv_upload"
+    )
+    
+    if uploaded_file is not None:
+        try:
+            uploaded_bytes = uploaded_file.getvalue()
+            upload_key = _upload_key(uploaded_bytes)
+            df_analysis = _parse_uploaded_csv(upload_key, uploaded_bytes)
+            
+            st.success(f"✅ CSV loaded successfully! Total rows: {len(df_analysis)}")
+            
+            # Display file info
+            col_file1, col_file2, col_file3 = st.columns(3)
+            with col_file1:
+                st.metric("Total Samples", len(df_analysis))
+            with col_file2:
+                if 'color_regions' in df_analysis.columns:
+                    st.metric("Regions", df_analysis['color_regions'].nunique())
+                else:
+                    st.metric("Regions", "N/A")
+            with col_file3:
+                st.metric("Columns", len(df_analysis.columns))
+            
+            # Show available columns
+            with st.expander("View Available Columns"):
+                st.write(df_analysis.columns.tolist())
+                st.dataframe(df_analysis.head(3))
+            
+            # Check for required columns
+            required_cols = ['RESP_FINAL', 'VIDEOS', 'L_main', 'a_main', 'b_main', 'L_reflect', 'a_reflect', 'b_reflect']
+            missing_cols = [col for col in required_cols if col not in df_analysis.columns]
+            
+            if missing_cols:
+                st.error(f"❌ Missing required columns: {', '.join(missing_cols)}")
+                st.info("Required columns: " + ", ".join(required_cols))
+            else:
+                # Region selection
+                if 'color_regions' in df_analysis.columns:
+                    available_regions = _get_available_regions(upload_key, df_analysis)
+                    
+                    col_region1, col_region2 = st.columns([2, 1])
+                    
+                    with col_region1:
+                        selected_region = st.selectbox(
+                            "Select Region to Analyze",
+                            options=available_regions,
+                            help="Choose which color region to analyze",
+                            key="quantile_region"
+                        )
+                    
+                    with col_region2:
+                        grid_size = st.slider(
+                            "Grid Size",
+                            min_value=2,
+                            max_value=6,
+                            value=4,
+                            help="Number of bins per dimension (e.g., 4 = 4x4 grid)",
+                            key="grid_size"
+                        )
+                    
+                    # Gallery thumbnails are generated at 2x their cell width (HiDPI); display still fills the column
+                    gallery_cell_px = GALLERY_WIDTH_PX // grid_size
+                    
+                    # Filter data for selected region
+                    df_region = _filter_region(upload_key, selected_region, df_analysis)
+                    
+                    if len(df_region) > 0:
+                        st.info(f"📍 Region {selected_region}: **{len(df_region)}** samples found")
                         
-                        # Filter data for selected region
-                        df_region = df_analysis[df_analysis['color_regions'] == selected_region].copy()
+                        # Analysis tabs for main and reflect
+                        analysis_tab1, analysis_tab2 = st.tabs(["🎨 Main Color", "✨ Reflect Color"])
                         
-                        if len(df_region) > 0:
-                            st.info(f"📍 Region {selected_region}: **{len(df_region)}** samples found")
+                        # MAIN COLOR ANALYSIS
+                        with analysis_tab1:
+                            st.subheader(f"Main Color Analysis - Region {selected_region}")
                             
-                            # Analysis tabs for main and reflect
-                            analysis_tab1, analysis_tab2 = st.tabs(["🎨 Main Color", "✨ Reflect Color"])
-                            
-                            # MAIN COLOR ANALYSIS
-                            with analysis_tab1:
-                                st.subheader(f"Main Color Analysis - Region {selected_region}")
-                                
-                                with st.spinner("Running quantile-based sampling for main color..."):
-                                    try:
-                                        selected_data_main = select_representative_samples_quantile(
-                                            df_region,
-                                            selected_region,
-                                            color_type='main',
-                                            grid_size=grid_size
+                            with st.spinner("Running quantile-based sampling for main color..."):
+                                try:
+                                    selected_data_main = _select_quantile_samples(
+                                        upload_key,
+                                        selected_region,
+                                        color_type='main',
+                                        grid_size=grid_size,
+                                        _df=df_analysis
+                                    )
+                                    
+                                    # Display metrics
+                                    col_m1, col_m2, col_m3 = st.columns(3)
+                                    with col_m1:
+                                        st.metric("L-C Grid Samples", len(selected_data_main['lc_samples']))
+                                    with col_m2:
+                                        st.metric("L-h Grid Samples", len(selected_data_main['lh_samples']))
+                                    with col_m3:
+                                        st.metric("Grid Size", f"{grid_size}x{grid_size}")
+                                    
+                                    # Create and display visualization
+                                    fig_main = _get_grid_figure(
+                                        upload_key,
+                                        selected_region,
+                                        color_type='main',
+                                        grid_size=grid_size,
+                                        _df=df_analysis
+                                    )
+                                    
+                                    st.plotly_chart(fig_main, use_container_width=True)
+                                    
+                                    # ===== IMAGE GALLERIES =====
+                                    st.markdown("---")
+                                    st.subheader("📸 Image Galleries - Clearer View")
+
+                                    gallery_col1, gallery_col2 = st.columns(2)
+
+                                    with gallery_col1:
+                                        _render_image_gallery(
+                                            "L vs C Grid Images", selected_data_main['lc_grid'], grid_size, gallery_cell_px,
+                                            caption_fmt="{respondent_id} - {shade}\nL:{L:.1f} C:{C:.1f}",
+                                            empty_message="No images loaded for L-C grid"
                                         )
-                                        
-                                        # Display metrics
-                                        col_m1, col_m2, col_m3 = st.columns(3)
-                                        with col_m1:
-                                            st.metric("L-C Grid Samples", len(selected_data_main['lc_samples']))
-                                        with col_m2:
-                                            st.metric("L-h Grid Samples", len(selected_data_main['lh_samples']))
-                                        with col_m3:
-                                            st.metric("Grid Size", f"{grid_size}x{grid_size}")
-                                        
-                                        # Create and display visualization
-                                        fig_main = create_grid_visualization_with_images(
-                                            selected_data_main,
-                                            selected_region,
-                                            color_type='main',
-                                            image_size=(80, 80)
+
+                                    with gallery_col2:
+                                        _render_image_gallery(
+                                            "L vs h Grid Images", selected_data_main['lh_grid'], grid_size, gallery_cell_px,
+                                            caption_fmt="{respondent_id} - {shade}\nL:{L:.1f} h:{h:.1f}°",
+                                            empty_message="No images loaded for L-h grid"
                                         )
-                                        
-                                        st.plotly_chart(fig_main, use_container_width=True)
-                                        
-                                        # ===== IMAGE GALLERIES =====
-                                        st.markdown("---")
-                                        st.subheader("📸 Image Galleries - Clearer View")
-
-                                        gallery_col1, gallery_col2 = st.columns(2)
-
-                                        # L-C Gallery
-                                        with gallery_col1:
-                                            st.markdown("##### L vs C Grid Images")
-                                            from src.quantile_viz import load_images_for_gallery
-                                            
-                                            images_lc = load_images_for_gallery(selected_data_main['lc_samples'])
-                                            
-                                            if images_lc:
-                                                # Create proper grid with correct positions
-                                                for row_idx in range(grid_size):
-                                                    cols = st.columns(grid_size)
-                                                    for col_idx in range(grid_size):
-                                                        # Find image that belongs in this grid position
-                                                        matching_img = None
-                                                        for img_info in images_lc:
-                                                            if 'L_bin' in img_info and 'C_bin' in img_info:
-                                                                if img_info['L_bin'] == row_idx and img_info['C_bin'] == col_idx:
-                                                                    matching_img = img_info
-                                                                    break
-                                                        
-                                                        with cols[col_idx]:
-                                                            if matching_img:
-                                                                st.image(
-                                                                    matching_img['image'],
-                                                                    caption=f"{matching_img['respondent_id']} - {matching_img['shade']}\nL:{matching_img['L']:.1f} C:{matching_img['C']:.1f}",
-                                                                    use_container_width=True
-                                                                )
-                                                            else:
-                                                                # Empty cell - show placeholder
-                                                                st.write("")
-                                            else:
-                                                st.warning("No images loaded for L-C grid")
-
-                                        # L-h Gallery
-                                        with gallery_col2:
-                                            st.markdown("##### L vs h Grid Images")
-                                            
-                                            images_lh = load_images_for_gallery(selected_data_main['lh_samples'])
-                                            
-                                            if images_lh:
-                                                # Create proper grid with correct positions
-                                                for row_idx in range(grid_size):
-                                                    cols = st.columns(grid_size)
-                                                    for col_idx in range(grid_size):
-                                                        # Find image that belongs in this grid position
-                                                        matching_img = None
-                                                        for img_info in images_lh:
-                                                            if 'L_bin_h' in img_info and 'h_bin' in img_info:
-                                                                if img_info['L_bin_h'] == row_idx and img_info['h_bin'] == col_idx:
-                                                                    matching_img = img_info
-                                                                    break
-                                                        
-                                                        with cols[col_idx]:
-                                                            if matching_img:
-                                                                st.image(
-                                                                    matching_img['image'],
-                                                                    caption=f"{matching_img['respondent_id']} - {matching_img['shade']}\nL:{matching_img['L']:.1f} h:{matching_img['h']:.1f}°",
-                                                                    use_container_width=True
-                                                                )
-                                                            else:
-                                                                # Empty cell - show placeholder
-                                                                st.write("")
-                                            else:
-                                                st.warning("No images loaded for L-h grid")
-                                        
-                                        # Export options
-                                        st.markdown("---")
-                                        st.subheader("📥 Export Data")
-                                        col_exp1, col_exp2 = st.columns(2)
-                                        
-                                        with col_exp1:
-                                            csv_lc_main = selected_data_main['lc_samples'][['RESP_FINAL', 'VIDEOS', 'XSHADE_S', 'L', 'C', 'h', 'L_bin', 'C_bin']].to_csv(index=False)
-                                            st.download_button(
-                                                label="📥 Download L-C Grid Data (Main)",
-                                                data=csv_lc_main,
-                                                file_name=f"region_{selected_region}_main_LC_grid.csv",
-                                                mime="text/csv",
-                                                key="download_lc_main"
-                                            )
-                                        
-                                        with col_exp2:
-                                            csv_lh_main = selected_data_main['lh_samples'][['RESP_FINAL', 'VIDEOS', 'XSHADE_S', 'L', 'C', 'h', 'L_bin_h', 'h_bin']].to_csv(index=False)
-                                            st.download_button(
-                                                label="📥 Download L-h Grid Data (Main)",
-                                                data=csv_lh_main,
-                                                file_name=f"region_{selected_region}_main_Lh_grid.csv",
-                                                mime="text/csv",
-                                                key="download_lh_main"
-                                            )
-                                        
-                                    except Exception as e:
-                                        st.error(f"Error in main color analysis: {str(e)}")
-                                        logger.error(f"Main color analysis error: {e}")
-                            
-                            # REFLECT COLOR ANALYSIS
-                            with analysis_tab2:
-                                st.subheader(f"Reflect Color Analysis - Region {selected_region}")
-                                
-                                with st.spinner("Running quantile-based sampling for reflect color..."):
-                                    try:
-                                        selected_data_reflect = select_representative_samples_quantile(
-                                            df_region,
-                                            selected_region,
-                                            color_type='reflect',
-                                            grid_size=grid_size
+                                    
+                                    # Export options
+                                    st.markdown("---")
+                                    st.subheader("📥 Export Data")
+                                    col_exp1, col_exp2 = st.columns(2)
+                                    
+                                    with col_exp1:
+                                        csv_lc_main = _get_grid_csv(upload_key, selected_region, 'main', grid_size, 'lc', df_analysis)
+                                        st.download_button(
+                                            label="📥 Download L-C Grid Data (Main)",
+                                            data=csv_lc_main,
+                                            file_name=f"region_{selected_region}_main_LC_grid.csv",
+                                            mime="text/csv",
+                                            key="download_lc_main"
                                         )
-                                        
-                                        # Display metrics
-                                        col_r1, col_r2, col_r3 = st.columns(3)
-                                        with col_r1:
-                                            st.metric("L-C Grid Samples", len(selected_data_reflect['lc_samples']))
-                                        with col_r2:
-                                            st.metric("L-h Grid Samples", len(selected_data_reflect['lh_samples']))
-                                        with col_r3:
-                                            st.metric("Grid Size", f"{grid_size}x{grid_size}")
-                                        
-                                        # Create and display visualization
-                                        fig_reflect = create_grid_visualization_with_images(
-                                            selected_data_reflect,
-                                            selected_region,
-                                            color_type='reflect',
-                                            image_size=(80, 80)
+                                    
+                                    with col_exp2:
+                                        csv_lh_main = _get_grid_csv(upload_key, selected_region, 'main', grid_size, 'lh', df_analysis)
+                                        st.download_button(
+                                            label="📥 Download L-h Grid Data (Main)",
+                                            data=csv_lh_main,
+                                            file_name=f"region_{selected_region}_main_Lh_grid.csv",
+                                            mime="text/csv",
+                                            key="download_lh_main"
                                         )
-                                        
-                                        st.plotly_chart(fig_reflect, use_container_width=True)
-                                        
-                                        # ===== IMAGE GALLERIES =====# ===== IMAGE GALLERIES =====
-                                        st.markdown("---")
-                                        st.subheader("📸 Image Galleries - Clearer View")
-
-                                        gallery_col1, gallery_col2 = st.columns(2)
-
-                                        # L-C Gallery
-                                        with gallery_col1:
-                                            st.markdown("##### L vs C Grid Images")
-                                            from src.quantile_viz import load_images_for_gallery
-                                            
-                                            images_lc = load_images_for_gallery(selected_data_main['lc_samples'])
-                                            
-                                            if images_lc:
-                                                # Create proper grid with correct positions
-                                                for row_idx in range(grid_size):
-                                                    cols = st.columns(grid_size)
-                                                    for col_idx in range(grid_size):
-                                                        # Find image that belongs in this grid position
-                                                        matching_img = None
-                                                        for img_info in images_lc:
-                                                            if 'L_bin' in img_info and 'C_bin' in img_info:
-                                                                if img_info['L_bin'] == row_idx and img_info['C_bin'] == col_idx:
-                                                                    matching_img = img_info
-                                                                    break
-                                                        
-                                                        with cols[col_idx]:
-                                                            if matching_img:
-                                                                st.image(
-                                                                    matching_img['image'],
-                                                                    caption=f"{matching_img['respondent_id']} - {matching_img['shade']}\nL:{matching_img['L']:.1f} C:{matching_img['C']:.1f}",
-                                                                    use_container_width=True
-                                                                )
-                                                            else:
-                                                                # Empty cell - show placeholder
-                                                                st.write("")
-                                            else:
-                                                st.warning("No images loaded for L-C grid")
-
-                                        # L-h Gallery
-                                        with gallery_col2:
-                                            st.markdown("##### L vs h Grid Images")
-                                            
-                                            images_lh = load_images_for_gallery(selected_data_main['lh_samples'])
-                                            
-                                            if images_lh:
-                                                # Create proper grid with correct positions
-                                                for row_idx in range(grid_size):
-                                                    cols = st.columns(grid_size)
-                                                    for col_idx in range(grid_size):
-                                                        # Find image that belongs in this grid position
-                                                        matching_img = None
-                                                        for img_info in images_lh:
-                                                            if 'L_bin_h' in img_info and 'h_bin' in img_info:
-                                                                if img_info['L_bin_h'] == row_idx and img_info['h_bin'] == col_idx:
-                                                                    matching_img = img_info
-                                                                    break
-                                                        
-                                                        with cols[col_idx]:
-                                                            if matching_img:
-                                                                st.image(
-                                                                    matching_img['image'],
-                                                                    caption=f"{matching_img['respondent_id']} - {matching_img['shade']}\nL:{matching_img['L']:.1f} h:{matching_img['h']:.1f}°",
-                                                                    use_container_width=True
-                                                                )
-                                                            else:
-                                                                # Empty cell - show placeholder
-                                                                st.write("")
-                                            else:
-                                                st.warning("No images loaded for L-h grid")
-                                        
-                                        # Export options
-                                        st.markdown("---")
-                                        st.subheader("📥 Export Data")
-                                        col_expr1, col_expr2 = st.columns(2)
-                                        
-                                        with col_expr1:
-                                            csv_lc_reflect = selected_data_reflect['lc_samples'][['RESP_FINAL', 'VIDEOS', 'XSHADE_S', 'L', 'C', 'h', 'L_bin', 'C_bin']].to_csv(index=False)
-                                            st.download_button(
-                                                label="📥 Download L-C Grid Data (Reflect)",
-                                                data=csv_lc_reflect,
-                                                file_name=f"region_{selected_region}_reflect_LC_grid.csv",
-                                                mime="text/csv",
-                                                key="download_lc_reflect"
-                                            )
-                                        
-                                        with col_expr2:
-                                            csv_lh_reflect = selected_data_reflect['lh_samples'][['RESP_FINAL', 'VIDEOS', 'XSHADE_S', 'L', 'C', 'h', 'L_bin_h', 'h_bin']].to_csv(index=False)
-                                            st.download_button(
-                                                label="📥 Download L-h Grid Data (Reflect)",
-                                                data=csv_lh_reflect,
-                                                file_name=f"region_{selected_region}_reflect_Lh_grid.csv",
-                                                mime="text/csv",
-                                                key="download_lh_reflect"
-                                            )
-                                        
-                                    except Exception as e:
-                                        st.error(f"Error in reflect color analysis: {str(e)}")
-                                        logger.error(f"Reflect color analysis error: {e}")
+                                    
+                                except Exception as e:
+                                    st.error(f"Error in main color analysis: {str(e)}")
+                                    logger.error(f"Main color analysis error: {e}")
+                        
+                        # REFLECT COLOR ANALYSIS
+                        with analysis_tab2:
+                            st.subheader(f"Reflect Color Analysis - Region {selected_region}")
                             
-                        else:
-                            st.error(f"No samples found for region {selected_region}")
-                    
+                            with st.spinner("Running quantile-based sampling for reflect color..."):
+                                try:
+                                    selected_data_reflect = _select_quantile_samples(
+                                        upload_key,
+                                        selected_region,
+                                        color_type='reflect',
+                                        grid_size=grid_size,
+                                        _df=df_analysis
+                                    )
+                                    
+                                    # Display metrics
+                                    col_r1, col_r2, col_r3 = st.columns(3)
+                                    with col_r1:
+                                        st.metric("L-C Grid Samples", len(selected_data_reflect['lc_samples']))
+                                    with col_r2:
+                                        st.metric("L-h Grid Samples", len(selected_data_reflect['lh_samples']))
+                                    with col_r3:
+                                        st.metric("Grid Size", f"{grid_size}x{grid_size}")
+                                    
+                                    # Create and display visualization
+                                    fig_reflect = _get_grid_figure(
+                                        upload_key,
+                                        selected_region,
+                                        color_type='reflect',
+                                        grid_size=grid_size,
+                                        _df=df_analysis
+                                    )
+                                    
+                                    st.plotly_chart(fig_reflect, use_container_width=True)
+                                    
+                                    # ===== IMAGE GALLERIES =====
+                                    st.markdown("---")
+                                    st.subheader("📸 Image Galleries - Clearer View")
+
+                                    gallery_col1, gallery_col2 = st.columns(2)
+
+                                    with gallery_col1:
+                                        _render_image_gallery(
+                                            "L vs C Grid Images", selected_data_reflect['lc_grid'], grid_size, gallery_cell_px,
+                                            caption_fmt="{respondent_id} - {shade}\nL:{L:.1f} C:{C:.1f}",
+                                            empty_message="No images loaded for L-C grid"
+                                        )
+
+                                    with gallery_col2:
+                                        _render_image_gallery(
+                                            "L vs h Grid Images", selected_data_reflect['lh_grid'], grid_size, gallery_cell_px,
+                                            caption_fmt="{respondent_id} - {shade}\nL:{L:.1f} h:{h:.1f}°",
+                                            empty_message="No images loaded for L-h grid"
+                                        )
+                                    
+                                    # Export options
+                                    st.markdown("---")
+                                    st.subheader("📥 Export Data")
+                                    col_expr1, col_expr2 = st.columns(2)
+                                    
+                                    with col_expr1:
+                                        csv_lc_reflect = _get_grid_csv(upload_key, selected_region, 'reflect', grid_size, 'lc', df_analysis)
+                                        st.download_button(
+                                            label="📥 Download L-C Grid Data (Reflect)",
+                                            data=csv_lc_reflect,
+                                            file_name=f"region_{selected_region}_reflect_LC_grid.csv",
+                                            mime="text/csv",
+                                            key="download_lc_reflect"
+                                        )
+                                    
+                                    with col_expr2:
+                                        csv_lh_reflect = _get_grid_csv(upload_key, selected_region, 'reflect', grid_size, 'lh', df_analysis)
+                                        st.download_button(
+                                            label="📥 Download L-h Grid Data (Reflect)",
+                                            data=csv_lh_reflect,
+                                            file_name=f"region_{selected_region}_reflect_Lh_grid.csv",
+                                            mime="text/csv",
+                                            key="download_lh_reflect"
+                                        )
+                                    
+                                except Exception as e:
+                                    st.error(f"Error in reflect color analysis: {str(e)}")
+                                    logger.error(f"Reflect color analysis error: {e}")
+                        
                     else:
-                        st.error("❌ Column 'color_regions' not found in CSV")
-                        st.info("Please ensure your CSV has a 'color_regions' column")
-            
-            except Exception as e:
-                st.error(f"Error loading CSV: {str(e)}")
-                logger.error(f"CSV loading error: {e}")
+                        st.error(f"No samples found for region {selected_region}")
+                
+                else:
+                    st.error("❌ Column 'color_regions' not found in CSV")
+                    st.info("Please ensure your CSV has a 'color_regions' column")
         
-        else:
-            st.info("👆 Please upload a CSV file to begin quantile grid analysis")
-            
-            st.markdown("""
-            ### Expected CSV Format
-            
-            Your CSV should contain the following columns:
-            - `RESP_FINAL`: Respondent ID (should match your 4-digit format)
-            - `VIDEOS`: Video/Shade identifier
-            - `color_regions`: Region number for grouping samples
-            - `L_main`, `a_main`, `b_main`: Lab color values for main color
-            - `L_reflect`, `a_reflect`, `b_reflect`: Lab color values for reflect color
-            - `XSHADE_S` (optional): Shade name
-            
-            The analysis will load actual respondent images based on the RESP_FINAL and VIDEOS values.
-            """)
+        except Exception as e:
+            st.error(f"Error loading CSV: {str(e)}")
+            logger.error(f"CSV loading error: {e}")
+    
     else:
-        st.info("👈 Switch to this tab to use Quantile Grid Analysis")
\ No newline at end of file
+        st.info("👆 Please upload a CSV file to begin quantile grid analysis")
+        
+        st.markdown("""
+        ### Expected CSV Format
+        
+        Your CSV should contain the following columns:
+        - `RESP_FINAL`: Respondent ID (should match your 4-digit format)
+        - `VIDEOS`: Video/Shade identifier
+        - `color_regions`: Region number for grouping samples
+        - `L_main`, `a_main`, `b_main`: Lab color values for main color
+        - `L_reflect`, `a_reflect`, `b_reflect`: Lab color values for reflect color
+        - `XSHADE_S` (optional): Shade name
+        
+        The analysis will load actual respondent images based on the RESP_FINAL and VIDEOS values.
+        """)
@@ -3,6 +3,7 @@ import logging
 import multiprocessing
 import torch
 from google.cloud import storage
+from requests.adapters import HTTPAdapter
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -11,9 +12,27 @@ logger = logging.getLogger(__name__)
 # Global device setting
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+# CPU count for optimization
+NB_VCPU = multiprocessing.cpu_count()
+
+# GCS connection pool, sized for the concurrent downloads (gallery fetches use up to
+# NB_VCPU * 4 threads); requests' default pool keeps only 10 connections per host
+GCS_POOL_SIZE = max(10, NB_VCPU * 4)
+
 # GCS bucket configuration
 BUCKET_NAME = "mcb-hair-bucket"
 storage_client = storage.Client()
+# storage.Client has no public option for the pool size. Its own authorized session
+# (client._http, built with the client's credentials, project and emulator settings)
+# gets the larger adapter mounted after construction; _http is private, so if a
+# google-cloud-storage release drops it the client keeps requests' default pool
+gcs_session = getattr(storage_client, "_http", None)
+if hasattr(gcs_session, "mount"):
+    gcs_adapter = HTTPAdapter(pool_connections=GCS_POOL_SIZE, pool_maxsize=GCS_POOL_SIZE)
+    gcs_session.mount("https://", gcs_adapter)
+    gcs_session.mount("http://", gcs_adapter)
+else:
+    logger.warning("storage.Client has no _http session; GCS downloads use the default connection pool")
 bucket = storage_client.bucket(BUCKET_NAME)
 
 # City folders mapping
@@ -27,12 +46,12 @@ CITY_FOLDERS = {
     7: "mcb_hair_bucket_dallas",
 }
 
+# Display names derived once from the folder names (e.g. 3 -> "Chicago")
+CITY_NAMES = {code: folder.replace("mcb_hair_bucket_", "").title() for code, folder in CITY_FOLDERS.items()}
+
 # Image format
 IMAGE_FORMAT = 'PNG'
 
-# CPU count for optimization
-NB_VCPU = multiprocessing.cpu_count()
-
 # CSV path template
 CSV_PATH_TEMPLATE = "{city_folder}/processed/results/color_extraction3/{id}.csv"
 
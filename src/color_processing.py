@@ -1,13 +1,20 @@
 """Color processing utilities for hair color remapping"""
+import logging
+from functools import lru_cache
 import numpy as np
 import pandas as pd
 from PIL import Image
 import luxpy as lx
-from config.settings import logger
+import torch
+from config.settings import logger, device
 
-def lab_to_rgb(lab_values):
-    """Convert Lab values to RGB values (0-255 range) using luxpy."""
-    lab_array = np.array(lab_values).reshape(1, 3)
+# Hair pixels remapped per pass in remap_hair_colors (bounds the size of the per-pass temporaries)
+REMAP_BLOCK_PIXELS = 65536
+
+@lru_cache(maxsize=4096)
+def _lab_rows_to_rgb(lab_rows: tuple) -> np.ndarray:
+    """Convert a tuple of (L, a, b) rows to RGB in one luxpy call (cached, read-only result)"""
+    lab_array = np.array(lab_rows, dtype=float)
     
     # Convert Lab to XYZ
     xyz_array = lx.lab_to_xyz(lab_array)
@@ -16,10 +23,24 @@ def lab_to_rgb(lab_values):
     rgb_array = lx.xyz_to_srgb(xyz_array)
     
     # Clip values to valid range and convert to integers
-    rgb_255 = np.clip(rgb_array.flatten(), 0, 255).astype(np.uint8)
+    rgb_255 = np.clip(rgb_array, 0, 255).astype(np.uint8)
+    rgb_255.setflags(write=False)
     
     return rgb_255
 
+def lab_to_rgb(lab_values):
+    """
+    Convert Lab values to RGB values (0-255 range) using luxpy.
+    
+    Accepts a single (L, a, b) triplet, returning an RGB triplet, or an (N, 3)
+    array of Lab rows, returning an (N, 3) array converted in a single call.
+    """
+    lab_array = np.asarray(lab_values, dtype=float)
+    lab_rows = tuple(map(tuple, lab_array.reshape(-1, 3).tolist()))
+    rgb_255 = _lab_rows_to_rgb(lab_rows).copy()
+    
+    return rgb_255[0] if lab_array.ndim == 1 else rgb_255
+
 def get_sample_info(df: pd.DataFrame) -> list:
     """
     Get information about all samples for selection
@@ -30,21 +51,24 @@ def get_sample_info(df: pd.DataFrame) -> list:
     Returns:
         list: List of sample information dictionaries
     """
+    # Balance score: how far each sample is from 33.33% per color, computed for all rows at once
+    proportions = df[[f'proportion_{i+1}' for i in range(3)]].to_numpy(dtype=float)
+    target_proportion = 100.0 / 3  # 33.33%
+    balance_scores = np.abs(proportions - target_proportion).sum(axis=1)
+    
+    filenames = df['filename'].tolist() if 'filename' in df.columns else [None] * len(df)
+    
     samples_info = []
     
-    for idx, row in df.iterrows():
-        # Calculate balance score (how far from 33.33% each)
-        proportions = [row[f'proportion_{i+1}'] for i in range(3)]
-        target_proportion = 100.0 / 3  # 33.33%
-        balance_score = sum(abs(prop - target_proportion) for prop in proportions)
-        
+    for idx, props, balance_score, filename in zip(df.index, proportions.tolist(), balance_scores.tolist(), filenames):
         # Get filename
-        filename = row.get('filename', f'Sample {idx+1}')
+        if filename is None:
+            filename = f'Sample {idx+1}'
         
         sample_info = {
             'index': idx,
             'filename': filename,
-            'proportions': proportions,
+            'proportions': props,
             'balance_score': balance_score,
             'display_name': f"Sample {idx+1}: {filename}" if filename != f'Sample {idx+1}' else f"Sample {idx+1}"
         }
@@ -69,13 +93,46 @@ def find_closest_color(pixel_rgb, cluster_centers):
     closest_index = np.argmin(distances)
     return cluster_centers[closest_index]
 
-def remap_hair_colors(image: Image.Image, mask: Image.Image, color_data: pd.Series, n_clusters: int = 3) -> Image.Image:
+def mask_to_bool(mask: Image.Image) -> np.ndarray:
+    """
+    Decode a hair mask into a boolean array of hair pixels
+    
+    Args:
+        mask (PIL.Image): Hair mask
+        
+    Returns:
+        np.ndarray: Contiguous (H, W) boolean array, True on hair pixels
+    """
+    # Single-channel masks: RGB conversion would repeat the value, so nonzero is hair
+    if mask.mode in ("L", "1"):
+        return np.asarray(mask) != 0
+    
+    # Read RGB(A) pixels directly; convert() would allocate a full RGB copy first
+    mask_np = np.asarray(mask) if mask.mode in ("RGB", "RGBA") else np.asarray(mask.convert("RGB"))
+    # A pixel is hair when all three channels are nonzero. Three per-channel compares
+    # on the strided views are several times faster than reducing over the short
+    # channel axis with all(axis=2), and produce a contiguous result directly
+    return (mask_np[:, :, 0] != 0) & (mask_np[:, :, 1] != 0) & (mask_np[:, :, 2] != 0)
+
+def _nearest_palette_index_torch(pixels: np.ndarray, palette: np.ndarray) -> np.ndarray:
+    """
+    Index of the nearest palette color for each (N, 3) uint8 pixel, computed on `device`
+    
+    Uses the same ||c||^2 - 2 p.c scores as the NumPy path; every term is an integer
+    below 2^24, so float32 is exact and ties resolve to the first center as well.
+    """
+    pixels_t = torch.from_numpy(pixels).to(device, dtype=torch.float32)
+    centers_t = torch.from_numpy(np.ascontiguousarray(palette)).to(device, dtype=torch.float32)
+    scores = (centers_t * centers_t).sum(dim=1) - 2 * (pixels_t @ centers_t.T)
+    return scores.argmin(dim=1).cpu().numpy()
+
+def remap_hair_colors(image: Image.Image, mask, color_data: pd.Series, n_clusters: int = 3) -> Image.Image:
     """
     Remap hair colors using the closest cluster colors from LAB data
     
     Args:
         image (PIL.Image): Original hair image
-        mask (PIL.Image): Hair mask
+        mask (PIL.Image or np.ndarray): Hair mask, or a boolean array from mask_to_bool
         color_data (pd.Series): Row of color data with LAB values
         n_clusters (int): Number of color clusters
         
@@ -83,56 +140,70 @@ def remap_hair_colors(image: Image.Image, mask: Image.Image, color_data: pd.Seri
         PIL.Image: Remapped image
     """
     try:
-        # Convert images to RGB if not already
-        image = image.convert("RGB")
-        mask = mask.convert("RGB")
+        # Convert image to RGB if not already (convert() copies even when the mode matches)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
         
-        # Check size compatibility
-        if image.size != mask.size:
-            logger.error(f"Image and mask size mismatch: {image.size} vs {mask.size}")
+        # Create mask for non-black pixels (hair areas), unless already decoded
+        non_black_mask = mask if isinstance(mask, np.ndarray) else mask_to_bool(mask)
+        
+        # Check size compatibility (numpy shape is (H, W), PIL size is (W, H))
+        if image.size != non_black_mask.shape[::-1]:
+            logger.error(f"Image and mask size mismatch: {image.size} vs {non_black_mask.shape[::-1]}")
             return image
         
-        # Convert to numpy arrays
+        # Convert to numpy array
         image_np = np.array(image)
-        mask_np = np.array(mask)
-        
-        # Create mask for non-black pixels (hair areas)
-        non_black_mask = (mask_np != [0, 0, 0]).all(axis=2)
-        
-        # Extract cluster centers from LAB data and convert to RGB using luxpy
-        cluster_centers = []
-        for i in range(n_clusters):
-            L = color_data[f'L_{i+1}']
-            a = color_data[f'a_{i+1}']
-            b = color_data[f'b_{i+1}']
-            
-            # Convert LAB to RGB using luxpy
-            lab_values = [L, a, b]
-            rgb_values = lab_to_rgb(lab_values)
-            cluster_centers.append(rgb_values)
-            
-            logger.info(f"Cluster {i+1}: LAB({L:.1f}, {a:.1f}, {b:.1f}) -> RGB({rgb_values[0]}, {rgb_values[1]}, {rgb_values[2]})")
-        
-        cluster_centers = np.array(cluster_centers).astype(int)
-        
-        # Apply color remapping only to hair pixels
-        indices = np.where(non_black_mask)
-        total_pixels = len(indices[0])
-        
-        logger.info(f"Starting color remapping for {total_pixels} hair pixels...")
-        
-        for i, (y, x) in enumerate(zip(indices[0], indices[1])):
-            original_rgb = image_np[y, x]
-            closest_rgb = find_closest_color(original_rgb, cluster_centers)
-            image_np[y, x] = closest_rgb
-            
-            # Log progress for large images
-            if i % 20000 == 0 and i > 0:
-                logger.info(f"Processed {i}/{total_pixels} pixels ({100*i/total_pixels:.1f}%)")
+        
+        # Extract cluster centers from LAB data and convert them to RGB in one luxpy call
+        lab_batch = np.array([
+            [color_data[f'L_{i+1}'], color_data[f'a_{i+1}'], color_data[f'b_{i+1}']]
+            for i in range(n_clusters)
+        ], dtype=float)
+        rgb_batch = lab_to_rgb(lab_batch)
+        
+        # Progress logging is skipped entirely (no formatting) when INFO is off
+        log_info = logger.isEnabledFor(logging.INFO)
+        if log_info:
+            for i, ((L, a, b), rgb_values) in enumerate(zip(lab_batch, rgb_batch)):
+                logger.info("Cluster %d: LAB(%.1f, %.1f, %.1f) -> RGB(%d, %d, %d)", i + 1, L, a, b, *rgb_values)
+        
+        # uint8 palette for the write-back (same dtype as the image, so no cast per
+        # pixel) and int32 centers for the distance math
+        palette = rgb_batch
+        centers = palette.astype(np.int32)
+        
+        # Apply color remapping only to hair pixels: nearest cluster center for all
+        # hair pixels at once. ||p - c||^2 = ||p||^2 - 2 p.c + ||c||^2 and ||p||^2 is
+        # the same for every center, so the argmin only needs an (N, k) product
+        # (exact in integers, so ties resolve as with the norm)
+        centers_sq = (centers * centers).sum(axis=1)
+        
+        # Flat indices of the hair pixels, computed once; gathers and scatters through a
+        # flat (H*W, 3) view are cheaper than boolean-mask indexing of the 3-D image
+        hair_idx = np.flatnonzero(non_black_mask)
+        flat_image = image_np.reshape(-1, 3)
+        total_pixels = len(hair_idx)
+        
+        if log_info:
+            logger.info("Starting color remapping for %d hair pixels...", total_pixels)
+        
+        if device.type == "cuda":
+            nearest = _nearest_palette_index_torch(flat_image[hair_idx], palette)
+            flat_image[hair_idx] = np.take(palette, nearest, axis=0)
+        else:
+            # Work through blocks of hair pixels so the temporaries stay cache-sized;
+            # flat_image is a view, so each block is written back into image_np in place
+            for start in range(0, total_pixels, REMAP_BLOCK_PIXELS):
+                block_idx = hair_idx[start:start + REMAP_BLOCK_PIXELS]
+                hair_pixels = flat_image[block_idx].astype(np.int32)
+                scores = centers_sq[None, :] - 2 * (hair_pixels @ centers.T)
+                flat_image[block_idx] = np.take(palette, scores.argmin(axis=1), axis=0)
         
         # Create remapped image
         remapped_image = Image.fromarray(image_np)
-        logger.info(f"Successfully remapped {total_pixels} hair pixels with {n_clusters} colors")
+        if log_info:
+            logger.info("Successfully remapped %d hair pixels with %d colors", total_pixels, n_clusters)
         
         return remapped_image
         
@@ -140,13 +211,13 @@ def remap_hair_colors(image: Image.Image, mask: Image.Image, color_data: pd.Seri
         logger.error(f"Error in color remapping: {str(e)}")
         return image
 
-def process_hair_color_remapping_with_sample(image: Image.Image, mask: Image.Image, df: pd.DataFrame, sample_index: int) -> Image.Image:
+def process_hair_color_remapping_with_sample(image: Image.Image, mask, df: pd.DataFrame, sample_index: int) -> Image.Image:
     """
     Process hair color remapping with a specific selected sample
     
     Args:
         image (PIL.Image): Original hair image
-        mask (PIL.Image): Hair mask
+        mask (PIL.Image or np.ndarray): Hair mask, or a boolean array from mask_to_bool
         df (pd.DataFrame): Color data DataFrame
         sample_index (int): Index of the sample to use for remapping
         
@@ -167,8 +238,8 @@ def process_hair_color_remapping_with_sample(image: Image.Image, mask: Image.Ima
     # Log selected sample info
     filename = selected_sample.get('filename', f'Sample {sample_index+1}')
     proportions = [selected_sample[f'proportion_{i+1}'] for i in range(3)]
-    logger.info(f"Using selected sample {sample_index+1}: {filename}")
-    logger.info(f"Color proportions: {proportions}")
+    logger.info("Using selected sample %d: %s", sample_index + 1, filename)
+    logger.info("Color proportions: %s", proportions)
     
     # Perform color remapping
     remapped_image = remap_hair_colors(image, mask, selected_sample, n_clusters=3)
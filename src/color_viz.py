@@ -1,14 +1,19 @@
 """Color visualization utilities"""
 import pandas as pd
 import plotly.graph_objects as go
-import plotly.express as px
 import numpy as np
 import luxpy as lx
 from config.settings import logger
 
 def lab_to_rgb(lab_values):
-    """Convert Lab values to RGB values (0-255 range) using luxpy."""
-    lab_array = np.array(lab_values).reshape(1, 3)
+    """
+    Convert Lab values to RGB values (0-255 range) using luxpy.
+    
+    Accepts a single (L, a, b) triplet, returning an RGB triplet, or an (N, 3)
+    array of Lab rows, returning an (N, 3) array converted in a single call.
+    """
+    lab_input = np.asarray(lab_values, dtype=float)
+    lab_array = lab_input.reshape(-1, 3)
     
     # Convert Lab to XYZ
     xyz_array = lx.lab_to_xyz(lab_array)
@@ -17,9 +22,9 @@ def lab_to_rgb(lab_values):
     rgb_array = lx.xyz_to_srgb(xyz_array)
     
     # Clip values to valid range and convert to integers
-    rgb_255 = np.clip(rgb_array.flatten(), 0, 255).astype(np.uint8)
+    rgb_255 = np.clip(rgb_array, 0, 255).astype(np.uint8)
     
-    return rgb_255
+    return rgb_255[0] if lab_input.ndim == 1 else rgb_255
 
 def create_color_bars(df: pd.DataFrame) -> go.Figure:
     """
@@ -46,53 +51,58 @@ def create_color_bars(df: pd.DataFrame) -> go.Figure:
     # L'Oréal color palette as fallback
     loreal_colors = ['#2649B2', '#4A74F3', '#8E7DE3', '#9D5CE6', '#D4D9F0', '#6C8BE0', '#B55CE6']
     
-    for idx, row in df.iterrows():
-        # Extract the 3 colors and their proportions
-        colors_data = []
-        for i in range(1, 4):  # 3 clusters
-            L = row[f'L_{i}']
-            a = row[f'a_{i}']
-            b = row[f'b_{i}']
-            proportion = row[f'proportion_{i}']
-            
-            # Convert LAB to RGB using luxpy for accurate colors
-            try:
-                lab_values = [L, a, b]
-                rgb_values = lab_to_rgb(lab_values)
-                rgb_color = f'rgb({rgb_values[0]}, {rgb_values[1]}, {rgb_values[2]})'
-            except Exception as e:
-                logger.warning(f"Error converting LAB to RGB for sample {idx}, cluster {i}: {e}")
-                # Fallback to L'Oréal palette color
-                rgb_color = loreal_colors[i-1] if i-1 < len(loreal_colors) else '#CCCCCC'
-            
-            colors_data.append({
-                'color': rgb_color,
-                'proportion': proportion,
-                'lab': f'L:{L:.1f} a:{a:.1f} b:{b:.1f}'
-            })
-        
-        # Create stacked bar for this row
-        y_pos = f"Sample {idx + 1}"
-        x_start = 0
+    # Convert all 3 clusters of every row to RGB in one luxpy call: (N, 3 clusters, Lab)
+    lab_all = np.stack(
+        [df[[f'L_{i}', f'a_{i}', f'b_{i}']].to_numpy(dtype=float) for i in range(1, 4)],
+        axis=1
+    )
+    lab_valid = np.isfinite(lab_all).all(axis=2)
+    rgb_all = np.zeros(lab_all.shape, dtype=np.uint8)
+    try:
+        if lab_valid.any():
+            rgb_all[lab_valid] = lab_to_rgb(lab_all[lab_valid])
+    except Exception as e:
+        logger.warning(f"Error converting LAB to RGB: {e}")
+        lab_valid[:] = False
+    if not lab_valid.all():
+        logger.warning(f"Missing or unconvertible LAB values for {(~lab_valid).sum()} colors, using fallback palette")
+    
+    # One trace per cluster, each carrying every sample, so the figure has 3 traces instead of 3 per row
+    y_labels = [f"Sample {idx + 1}" for idx in df.index]
+    proportions = df[[f'proportion_{i}' for i in range(1, 4)]].to_numpy(dtype=float)
+    bases = np.zeros_like(proportions)
+    bases[:, 1:] = np.cumsum(proportions[:, :-1], axis=1)
+    
+    # Color strings for every sample and cluster, built in one pass: (N, 3 clusters)
+    rgb_strings = np.array(
+        ['rgb({}, {}, {})'.format(*rgb) for rgb in rgb_all.reshape(-1, 3).tolist()],
+        dtype=object
+    ).reshape(lab_valid.shape)
+    # Fallback to L'Oréal palette colors where the LAB conversion is unavailable
+    fallback_colors = np.array(loreal_colors[:3], dtype=object)
+    rgb_strings = np.where(lab_valid, rgb_strings, fallback_colors)
+    
+    for i in range(1, 4):  # 3 clusters
+        colors = rgb_strings[:, i-1].tolist()
+        hover_texts = [
+            f"<b>Color {i}</b><br>"
+            f"Proportion: {proportion:.2f}<br>"
+            f"LAB: L:{L:.1f} a:{a:.1f} b:{b:.1f}<br>"
+            for proportion, (L, a, b) in zip(proportions[:, i-1].tolist(), lab_all[:, i-1].tolist())
+        ]
         
-        for i, color_info in enumerate(colors_data):
-            fig.add_trace(go.Bar(
-                name=f'Color {i+1}' if idx == 0 else None,  # Only show legend for first row
-                x=[color_info['proportion']],
-                y=[y_pos],
-                orientation='h',
-                marker_color=color_info['color'],
-                text=f"{color_info['proportion']:.2f}",
-                textposition='inside',
-                hovertemplate=f"<b>Color {i+1}</b><br>" +
-                             f"Proportion: {color_info['proportion']:.2f}<br>" +
-                             f"LAB: {color_info['lab']}<br>" +
-                             "<extra></extra>",
-                showlegend=(idx == 0),  # Only show legend for first row
-                offsetgroup=idx,
-                base=x_start
-            ))
-            x_start += color_info['proportion']
+        fig.add_trace(go.Bar(
+            name=f'Color {i}',
+            x=proportions[:, i-1],
+            y=y_labels,
+            orientation='h',
+            marker_color=colors,
+            text=[f"{proportion:.2f}" for proportion in proportions[:, i-1].tolist()],
+            textposition='inside',
+            hovertext=hover_texts,
+            hovertemplate="%{hovertext}<extra></extra>",
+            base=bases[:, i-1]
+        ))
     
     fig.update_layout(
         title="Hair Color Distribution",
@@ -1,9 +1,14 @@
 """Data loading utilities for hair color analysis"""
+from functools import lru_cache
 import pandas as pd
 from PIL import Image
+import streamlit as st
 from config.settings import CITY_FOLDERS, CSV_PATH_TEMPLATE, logger
-from src.gcp_client import get_csv_from_gcs, get_image_from_gcs, get_mask_from_gcs
+from src.gcp_client import (
+    GCS_CACHE_TTL, TRANSIENT_GCS_ERRORS, get_csv_from_gcs, get_image_from_gcs, get_mask_from_gcs
+)
 
+@lru_cache(maxsize=2048)
 def get_city_from_id(respondent_id: str) -> int:
     """
     Extract city code from respondent ID
@@ -23,6 +28,7 @@ def get_city_from_id(respondent_id: str) -> int:
     
     return city_code
 
+@lru_cache(maxsize=2048)
 def build_csv_path(respondent_id: str) -> str:
     """
     Build the GCS path to the CSV file for a given respondent ID
@@ -43,6 +49,7 @@ def build_csv_path(respondent_id: str) -> str:
     
     return csv_path
 
+@lru_cache(maxsize=2048)
 def build_image_path(respondent_id: str, shade: str) -> str:
     """
     Build the GCS path to the image file for a given respondent ID and shade
@@ -61,6 +68,7 @@ def build_image_path(respondent_id: str, shade: str) -> str:
     
     return image_path
 
+@lru_cache(maxsize=2048)
 def build_mask_path(respondent_id: str, shade: str) -> str:
     """
     Build the GCS path to the mask file for a given respondent ID and shade
@@ -79,20 +87,39 @@ def build_mask_path(respondent_id: str, shade: str) -> str:
     
     return mask_path
 
-def load_respondent_data(respondent_id: str, shade: str = None) -> pd.DataFrame:
+@st.cache_data(ttl=GCS_CACHE_TTL, max_entries=128, show_spinner=False)
+def load_respondent_csv(respondent_id: str) -> pd.DataFrame:
+    """
+    Load the full hair color CSV for a respondent (all shades)
+    
+    Cached per respondent, so the shade list and the per-shade data share one
+    download and parse. A missing or unparsable CSV is cached as an empty DataFrame;
+    GCS/network errors are raised instead, so they are retried on the next call.
+    
+    Args:
+        respondent_id (str): 4-digit respondent ID
+        
+    Returns:
+        pd.DataFrame: Hair color data for every shade
+    """
+    csv_path = build_csv_path(respondent_id)
+    return get_csv_from_gcs(csv_path, raise_errors=True)
+
+def load_respondent_data(respondent_id: str, shade: str = None, raise_errors: bool = False) -> pd.DataFrame:
     """
     Load hair color data for a specific respondent
     
     Args:
         respondent_id (str): 4-digit respondent ID
         shade (str, optional): Specific shade to filter. If None, returns all shades
+        raise_errors (bool): Re-raise GCS/network errors instead of returning an empty DataFrame
+            (missing or malformed data still gives an empty DataFrame)
         
     Returns:
         pd.DataFrame: Hair color data
     """
     try:
-        csv_path = build_csv_path(respondent_id)
-        df = get_csv_from_gcs(csv_path)
+        df = load_respondent_csv(respondent_id)
         
         if df.empty:
             logger.warning(f"No data found for respondent {respondent_id}")
@@ -112,22 +139,26 @@ def load_respondent_data(respondent_id: str, shade: str = None) -> pd.DataFrame:
         
     except Exception as e:
         logger.error(f"Error loading data for respondent {respondent_id}: {str(e)}")
+        if raise_errors and isinstance(e, TRANSIENT_GCS_ERRORS):
+            raise
         return pd.DataFrame()
 
-def load_respondent_image(respondent_id: str, shade: str) -> Image.Image:
+def load_respondent_image(respondent_id: str, shade: str, raise_errors: bool = False) -> Image.Image:
     """
     Load hair color image for a specific respondent and shade
     
     Args:
         respondent_id (str): 4-digit respondent ID
         shade (str): Hair shade
+        raise_errors (bool): Re-raise GCS/network errors instead of returning None
+            (a missing or undecodable image still gives None)
         
     Returns:
         PIL.Image: Image object, or None if not found
     """
     try:
         image_path = build_image_path(respondent_id, shade)
-        image = get_image_from_gcs(image_path)
+        image = get_image_from_gcs(image_path, raise_errors=raise_errors)
         
         if image:
             logger.info(f"Successfully loaded image for respondent {respondent_id}, shade {shade}")
@@ -138,22 +169,26 @@ def load_respondent_image(respondent_id: str, shade: str) -> Image.Image:
         
     except Exception as e:
         logger.error(f"Error loading image for respondent {respondent_id}, shade {shade}: {str(e)}")
+        if raise_errors and isinstance(e, TRANSIENT_GCS_ERRORS):
+            raise
         return None
 
-def load_respondent_mask(respondent_id: str, shade: str) -> Image.Image:
+def load_respondent_mask(respondent_id: str, shade: str, raise_errors: bool = False) -> Image.Image:
     """
     Load hair mask for a specific respondent and shade
     
     Args:
         respondent_id (str): 4-digit respondent ID
         shade (str): Hair shade
+        raise_errors (bool): Re-raise GCS/network errors instead of returning None
+            (a missing or undecodable mask still gives None)
         
     Returns:
         PIL.Image: Mask image object, or None if not found
     """
     try:
         mask_path = build_mask_path(respondent_id, shade)
-        mask = get_mask_from_gcs(mask_path)
+        mask = get_mask_from_gcs(mask_path, raise_errors=raise_errors)
         
         if mask:
             logger.info(f"Successfully loaded mask for respondent {respondent_id}, shade {shade}")
@@ -164,21 +199,24 @@ def load_respondent_mask(respondent_id: str, shade: str) -> Image.Image:
         
     except Exception as e:
         logger.error(f"Error loading mask for respondent {respondent_id}, shade {shade}: {str(e)}")
+        if raise_errors and isinstance(e, TRANSIENT_GCS_ERRORS):
+            raise
         return None
 
-def get_available_shades(respondent_id: str) -> list:
+def get_available_shades(respondent_id: str, raise_errors: bool = False) -> list:
     """
     Get list of available shades for a respondent
     
     Args:
         respondent_id (str): 4-digit respondent ID
+        raise_errors (bool): Re-raise GCS/network errors instead of returning an empty list
+            (missing or malformed data still gives an empty list)
         
     Returns:
         list: List of available shades
     """
     try:
-        csv_path = build_csv_path(respondent_id)
-        df = get_csv_from_gcs(csv_path)
+        df = load_respondent_csv(respondent_id)
         
         if df.empty:
             return []
@@ -187,4 +225,6 @@ def get_available_shades(respondent_id: str) -> list:
         
     except Exception as e:
         logger.error(f"Error getting shades for respondent {respondent_id}: {str(e)}")
+        if raise_errors and isinstance(e, TRANSIENT_GCS_ERRORS):
+            raise
         return []
\ No newline at end of file
@@ -2,91 +2,126 @@
 import pandas as pd
 import io
 from PIL import Image
+import requests
 import streamlit as st
+from google.api_core.exceptions import GoogleAPIError
+from google.auth.exceptions import TransportError
+from google.cloud.exceptions import NotFound
 from config.settings import bucket, logger
 
-def get_csv_from_gcs(blob_path: str) -> pd.DataFrame:
+# Seconds the cached loaders reuse a loaded blob (or a missing-blob result) before GCS
+# is asked again. Blobs are not cached here: data_loader keeps CSVs parsed and app.py
+# keeps images and masks decoded, so caching their bytes too would hold everything twice
+GCS_CACHE_TTL = 3600
+
+# Errors that may pass on a retry: GCS API failures and network problems. Anything else
+# (a malformed CSV, an undecodable image) fails the same way every time, so it is
+# handled like a missing blob
+TRANSIENT_GCS_ERRORS = (GoogleAPIError, TransportError, requests.RequestException)
+
+def _download_blob(blob_path: str) -> bytes:
+    """Download a blob's raw bytes (None if the blob does not exist)"""
+    # A single GET: a missing blob surfaces as NotFound instead of needing an exists() round-trip
+    try:
+        return bucket.blob(blob_path).download_as_bytes()
+    except NotFound:
+        return None
+
+def get_csv_from_gcs(blob_path: str, raise_errors: bool = False) -> pd.DataFrame:
     """
     Download and read CSV file from GCS bucket
     
     Args:
         blob_path (str): Path to the CSV file in the bucket
+        raise_errors (bool): Re-raise GCS/network errors instead of returning an empty
+            DataFrame (a missing blob or an unparsable CSV still gives an empty DataFrame),
+            so cached callers do not keep a transient failure
         
     Returns:
         pd.DataFrame: DataFrame containing the CSV data
     """
     try:
-        blob = bucket.blob(blob_path)
+        csv_content = _download_blob(blob_path)
         
-        if not blob.exists():
+        if csv_content is None:
             logger.error(f"Blob {blob_path} does not exist")
             return pd.DataFrame()
         
-        # Download as string and read with pandas
-        csv_content = blob.download_as_string()
-        df = pd.read_csv(io.StringIO(csv_content.decode('utf-8')))
+        # Read the downloaded bytes with pandas
+        df = pd.read_csv(io.BytesIO(csv_content), encoding='utf-8')
         
         logger.info(f"Successfully loaded CSV from {blob_path}")
         return df
         
     except Exception as e:
         logger.error(f"Error loading CSV from {blob_path}: {str(e)}")
+        if raise_errors and isinstance(e, TRANSIENT_GCS_ERRORS):
+            raise
         return pd.DataFrame()
 
-def get_image_from_gcs(blob_path: str) -> Image.Image:
+def get_image_from_gcs(blob_path: str, raise_errors: bool = False) -> Image.Image:
     """
     Download and load image file from GCS bucket
     
     Args:
         blob_path (str): Path to the image file in the bucket
+        raise_errors (bool): Re-raise GCS/network errors instead of returning None
+            (a missing blob or an undecodable image still gives None)
         
     Returns:
         PIL.Image: Image object, or None if not found
     """
     try:
-        blob = bucket.blob(blob_path)
+        image_bytes = _download_blob(blob_path)
         
-        if not blob.exists():
+        if image_bytes is None:
             logger.error(f"Image blob {blob_path} does not exist")
             return None
         
-        # Download image as bytes and load with PIL
-        image_bytes = blob.download_as_bytes()
+        # Load the downloaded image bytes with PIL
         image = Image.open(io.BytesIO(image_bytes))
+        # Decode now (in the loading thread) and release the compressed buffer
+        image.load()
         
         logger.info(f"Successfully loaded image from {blob_path}")
         return image
         
     except Exception as e:
         logger.error(f"Error loading image from {blob_path}: {str(e)}")
+        if raise_errors and isinstance(e, TRANSIENT_GCS_ERRORS):
+            raise
         return None
 
-def get_mask_from_gcs(blob_path: str) -> Image.Image:
+def get_mask_from_gcs(blob_path: str, raise_errors: bool = False) -> Image.Image:
     """
     Download and load mask file from GCS bucket
     
     Args:
         blob_path (str): Path to the mask file in the bucket
+        raise_errors (bool): Re-raise GCS/network errors instead of returning None
+            (a missing blob or an undecodable mask still gives None)
         
     Returns:
         PIL.Image: Mask image object, or None if not found
     """
     try:
-        blob = bucket.blob(blob_path)
+        mask_bytes = _download_blob(blob_path)
         
-        if not blob.exists():
+        if mask_bytes is None:
             logger.error(f"Mask blob {blob_path} does not exist")
             return None
         
-        # Download mask as bytes and load with PIL
-        mask_bytes = blob.download_as_bytes()
+        # Load the downloaded mask bytes with PIL
         mask = Image.open(io.BytesIO(mask_bytes))
+        mask.load()
         
         logger.info(f"Successfully loaded mask from {blob_path}")
         return mask
         
     except Exception as e:
         logger.error(f"Error loading mask from {blob_path}: {str(e)}")
+        if raise_errors and isinstance(e, TRANSIENT_GCS_ERRORS):
+            raise
         return None
 
 def find_swatch_in_folders(swatch_name_prefix: str, folders: list) -> tuple:
@@ -108,10 +143,10 @@ def find_swatch_in_folders(swatch_name_prefix: str, folders: list) -> tuple:
         swatch_path = f"{folder_path}/{swatch_filename}"
         
         try:
-            blob = bucket.blob(swatch_path)
-            if blob.exists():
-                image_bytes = blob.download_as_bytes()
+            image_bytes = _download_blob(swatch_path)
+            if image_bytes is not None:
                 image = Image.open(io.BytesIO(image_bytes))
+                image.load()
                 logger.info(f"Found swatch: {swatch_path}")
                 return image, swatch_path
         except Exception as e:
@@ -120,20 +155,3 @@ def find_swatch_in_folders(swatch_name_prefix: str, folders: list) -> tuple:
     
     logger.warning(f"Swatch not found for prefix: {swatch_name_prefix}")
     return None, None
-
-def check_blob_exists(blob_path: str) -> bool:
-    """
-    Check if a blob exists in the bucket
-    
-    Args:
-        blob_path (str): Path to check
-        
-    Returns:
-        bool: True if exists, False otherwise
-    """
-    try:
-        blob = bucket.blob(blob_path)
-        return blob.exists()
-    except Exception as e:
-        logger.error(f"Error checking blob existence {blob_path}: {str(e)}")
-        return False
\ No newline at end of file
@@ -1,17 +1,35 @@
 """Quantile-based grid sampling for hair color analysis"""
 import pandas as pd
 import numpy as np
-from scipy.spatial.distance import euclidean
 from config.settings import logger
 
 def lab_to_lch(L, a, b):
-    """Convert Lab to LCh (Lightness, Chroma, Hue)"""
+    """Convert Lab to LCh (Lightness, Chroma, Hue); accepts scalars or NumPy arrays"""
     C = np.sqrt(a**2 + b**2)
     h = np.arctan2(b, a) * 180 / np.pi
-    if h < 0:
-        h += 360
+    h = np.where(h < 0, h + 360, h)
     return L, C, h
 
+def assign_quantile_bins(values, bins):
+    """
+    Bin index of each value, as pd.cut(values, bins, labels=False, include_lowest=True,
+    duplicates='drop') would assign it, using a binary search over the edges
+    
+    Returns an int array, or a float array with NaN for values outside the edges.
+    """
+    values = np.asarray(values, dtype=float)
+    edges = np.unique(bins)  # sorted, repeated quantile edges dropped
+    
+    # Intervals are (e[i], e[i+1]], with the lowest edge itself included in bin 0
+    labels = np.maximum(np.searchsorted(edges, values, side='left') - 1, 0)
+    
+    # A single distinct edge leaves no interval at all
+    outside = ~((values >= edges[0]) & (values <= edges[-1])) | (len(edges) < 2)
+    if outside.any():
+        labels = labels.astype(float)
+        labels[outside] = np.nan
+    return labels
+
 def select_representative_samples_quantile(df_region, region_num, color_type='main', grid_size=4):
     """
     Select representative samples using quantile-based binning in LCh space
@@ -23,34 +41,29 @@ def select_representative_samples_quantile(df_region, region_num, color_type='ma
     - grid_size: Number of bins per dimension (default 4 for 4x4)
     
     Returns:
-    - Dictionary with selected samples for L-C and L-h grids
+    - Dictionary with selected samples for L-C and L-h grids; 'lc_grid' / 'lh_grid'
+      map each (row bin, column bin) cell to its representative sample
     """
     
-    df = df_region.copy()
-    
-    # Convert all samples to LCh
-    lch_data = []
-    for idx, row in df.iterrows():
-        L = row[f'L_{color_type}']
-        a = row[f'a_{color_type}']
-        b = row[f'b_{color_type}']
-        
-        L_val, C_val, h_val = lab_to_lch(L, a, b)
-        
-        lch_data.append({
-            'index': idx,
-            'RESP_FINAL': row['RESP_FINAL'],
-            'VIDEOS': row['VIDEOS'],
-            'XSHADE_S': row.get('XSHADE_S', ''),
-            'L': L_val,
-            'C': C_val,
-            'h': h_val,
-            'L_lab': L,
-            'a_lab': a,
-            'b_lab': b
-        })
-    
-    df_lch = pd.DataFrame(lch_data)
+    # Convert all samples to LCh on the column arrays (no frame copy, no per-row Series)
+    L = df_region[f'L_{color_type}'].to_numpy()
+    a = df_region[f'a_{color_type}'].to_numpy()
+    b = df_region[f'b_{color_type}'].to_numpy()
+    
+    L_val, C_val, h_val = lab_to_lch(L, a, b)
+    
+    df_lch = pd.DataFrame({
+        'index': df_region.index.to_numpy(),
+        'RESP_FINAL': df_region['RESP_FINAL'].to_numpy(),
+        'VIDEOS': df_region['VIDEOS'].to_numpy(),
+        'XSHADE_S': df_region['XSHADE_S'].to_numpy() if 'XSHADE_S' in df_region.columns else '',
+        'L': L_val,
+        'C': C_val,
+        'h': h_val,
+        'L_lab': L,
+        'a_lab': a,
+        'b_lab': b
+    })
     
     logger.info(f"Quantile-based sampling - Region {region_num} ({color_type})")
     logger.info(f"Total samples: {len(df_lch)}, Grid: {grid_size}x{grid_size}")
@@ -63,54 +76,50 @@ def select_representative_samples_quantile(df_region, region_num, color_type='ma
     h_bins = df_lch['h'].quantile(quantiles).values
     
     # Assign grid cells for L-C space
-    df_lch['L_bin'] = pd.cut(df_lch['L'], bins=L_bins, labels=False, include_lowest=True, duplicates='drop')
-    df_lch['C_bin'] = pd.cut(df_lch['C'], bins=C_bins, labels=False, include_lowest=True, duplicates='drop')
+    df_lch['L_bin'] = assign_quantile_bins(L_val, L_bins)
+    df_lch['C_bin'] = assign_quantile_bins(C_val, C_bins)
     
     # Assign grid cells for L-h space
-    df_lch['L_bin_h'] = pd.cut(df_lch['L'], bins=L_bins, labels=False, include_lowest=True, duplicates='drop')
-    df_lch['h_bin'] = pd.cut(df_lch['h'], bins=h_bins, labels=False, include_lowest=True, duplicates='drop')
-    
-    # Select representative for each L-C grid cell
-    selected_lc = []
-    
-    for L_idx in range(grid_size):
-        for C_idx in range(grid_size):
-            cell_samples = df_lch[(df_lch['L_bin'] == L_idx) & (df_lch['C_bin'] == C_idx)]
-            
-            if len(cell_samples) > 0:
-                # Cell center
-                L_center = (L_bins[L_idx] + L_bins[L_idx + 1]) / 2
-                C_center = (C_bins[C_idx] + C_bins[C_idx + 1]) / 2
-                
-                # Find sample closest to cell center
-                cell_samples['dist_to_center'] = cell_samples.apply(
-                    lambda row: euclidean([row['L'], row['C']], [L_center, C_center]), 
-                    axis=1
-                )
-                
-                representative = cell_samples.loc[cell_samples['dist_to_center'].idxmin()]
-                selected_lc.append(representative)
-    
-    # Select representative for each L-h grid cell
-    selected_lh = []
-    
-    for L_idx in range(grid_size):
-        for h_idx in range(grid_size):
-            cell_samples = df_lch[(df_lch['L_bin_h'] == L_idx) & (df_lch['h_bin'] == h_idx)]
-            
-            if len(cell_samples) > 0:
-                # Cell center
-                L_center = (L_bins[L_idx] + L_bins[L_idx + 1]) / 2
-                h_center = (h_bins[h_idx] + h_bins[h_idx + 1]) / 2
-                
-                # Find sample closest to cell center
-                cell_samples['dist_to_center'] = cell_samples.apply(
-                    lambda row: euclidean([row['L'], row['h']], [L_center, h_center]), 
-                    axis=1
-                )
-                
-                representative = cell_samples.loc[cell_samples['dist_to_center'].idxmin()]
-                selected_lh.append(representative)
+    df_lch['L_bin_h'] = df_lch['L_bin']
+    df_lch['h_bin'] = assign_quantile_bins(h_val, h_bins)
+    
+    # Cell centers along each axis, looked up by bin label
+    L_centers = (L_bins[:-1] + L_bins[1:]) / 2
+    C_centers = (C_bins[:-1] + C_bins[1:]) / 2
+    h_centers = (h_bins[:-1] + h_bins[1:]) / 2
+    
+    def select_cell_representatives(row_bin, col_bin, x_col, y_col, x_centers, y_centers):
+        """
+        Pick the sample closest to its cell center in every occupied cell with one groupby
+        
+        Returns a dictionary (row bin, column bin) -> representative row (with its
+        dist_to_center), in ascending cell order.
+        """
+        binned = df_lch[[row_bin, col_bin, x_col, y_col]].dropna(subset=[row_bin, col_bin])
+        row_bins = binned[row_bin].to_numpy(dtype=int)
+        col_bins = binned[col_bin].to_numpy(dtype=int)
+        
+        dist = pd.Series(
+            np.sqrt((binned[x_col].to_numpy() - x_centers[row_bins]) ** 2 +
+                    (binned[y_col].to_numpy() - y_centers[col_bins]) ** 2),
+            index=binned.index
+        )
+        best_labels = dist.groupby([row_bins, col_bins]).idxmin()
+        
+        grid = {}
+        for (row_idx, col_idx), label in best_labels.items():
+            representative = df_lch.loc[label].copy()
+            representative['dist_to_center'] = dist[label]
+            grid[(int(row_idx), int(col_idx))] = representative
+        return grid
+    
+    # Select representative for each L-C grid cell (one per cell, also indexed by (L_bin, C_bin))
+    grid_lc = select_cell_representatives('L_bin', 'C_bin', 'L', 'C', L_centers, C_centers)
+    selected_lc = list(grid_lc.values())
+    
+    # Select representative for each L-h grid cell (one per cell, also indexed by (L_bin_h, h_bin))
+    grid_lh = select_cell_representatives('L_bin_h', 'h_bin', 'L', 'h', L_centers, h_centers)
+    selected_lh = list(grid_lh.values())
     
     df_selected_lc = pd.DataFrame(selected_lc)
     df_selected_lh = pd.DataFrame(selected_lh)
@@ -120,6 +129,8 @@ def select_representative_samples_quantile(df_region, region_num, color_type='ma
     return {
         'lc_samples': df_selected_lc,
         'lh_samples': df_selected_lh,
+        'lc_grid': grid_lc,
+        'lh_grid': grid_lh,
         'bins': {
             'L': L_bins,
             'C': C_bins,
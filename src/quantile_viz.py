@@ -2,33 +2,145 @@
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import numpy as np
-from config.settings import logger
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from config.settings import logger, NB_VCPU
 from src.data_loader import load_respondent_image
+from src.gcp_client import GCS_CACHE_TTL
 from src.quantile_analysis import format_respondent_id, format_shade_name
 import base64
+from PIL import Image
 from io import BytesIO
 
-def pil_to_base64(image, size=(100, 100)):
-    """Convert PIL Image to base64 string for Plotly"""
+# Grid figure height, and the part of it left to the plot area by Plotly's default margins
+GRID_FIGURE_HEIGHT = 600
+GRID_PLOT_HEIGHT_PX = GRID_FIGURE_HEIGHT - 100 - 80
+
+# Grid thumbnails are encoded at 2x their on-screen size (HiDPI), within these bounds
+GRID_THUMBNAIL_PIXEL_RATIO = 2
+GRID_THUMBNAIL_MIN_PX = 32
+GRID_THUMBNAIL_MAX_PX = 128
+
+# Gallery cells are far wider than grid figure images (up to half the gallery width),
+# so their thumbnails get the same ratio and lower bound with a larger upper bound
+GALLERY_THUMBNAIL_MAX_PX = 512
+
+# Gallery images are independent GCS downloads, so they are fetched concurrently
+GALLERY_FETCH_WORKERS = min(32, NB_VCPU * 4)
+
+# RESP_FINAL / VIDEOS values repeat across grids and rebuilds, so their formatting is memoized
+_format_respondent_id = lru_cache(maxsize=4096)(format_respondent_id)
+_format_shade_name = lru_cache(maxsize=4096)(format_shade_name)
+
+def _data_uri(buffered, mime_type):
+    """Base64 data URI for the bytes written to a BytesIO (encoded from its buffer, without a copy)"""
+    with buffered.getbuffer() as view:
+        return f"data:{mime_type};base64,{base64.b64encode(view).decode('ascii')}"
+
+def pil_to_base64(image, size=(100, 100), fmt="JPEG"):
+    """
+    Convert PIL Image to base64 string for Plotly
+    
+    Thumbnails are JPEG by default (much cheaper to encode and smaller than PNG);
+    pass fmt="PNG" where transparency must be kept.
+    """
     if image is None:
         return None
     
     try:
-        # Resize image
-        img_resized = image.resize(size)
+        # Resize image (bilinear: indistinguishable from the bicubic default at thumbnail size, and cheaper)
+        img_resized = image.resize(size, Image.Resampling.BILINEAR)
         
         # Convert to base64
         buffered = BytesIO()
-        img_resized.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+        if fmt == "JPEG":
+            if img_resized.mode != "RGB":
+                img_resized = img_resized.convert("RGB")
+            img_resized.save(buffered, format="JPEG", quality=80)
+        else:
+            img_resized.save(buffered, format=fmt, compress_level=1)
         
-        return f"data:image/png;base64,{img_str}"
+        return _data_uri(buffered, f"image/{fmt.lower()}")
     except Exception as e:
         logger.error(f"Error converting image to base64: {e}")
         return None
 
+@st.cache_data(ttl=GCS_CACHE_TTL, max_entries=512, show_spinner=False)
+def _grid_thumbnail(respondent_id, shade, size):
+    """
+    Load one respondent image and encode it as a base64 thumbnail
+    
+    Cached per (respondent_id, shade, size), so rebuilding a grid figure (other
+    region, grid size or color type) reuses thumbnails already encoded. A missing
+    or unencodable image is cached as None; GCS/network errors are raised rather
+    than cached, so the thumbnail is retried on the next render.
+    """
+    # pil_to_base64 passes a missing image through as None (and logs encoding errors)
+    return pil_to_base64(load_respondent_image(respondent_id, shade, raise_errors=True), size)
+
+def _grid_thumbnail_or_none(respondent_id, shade, size):
+    """Grid thumbnail, or None if there is no image or it could not be loaded"""
+    try:
+        return _grid_thumbnail(respondent_id, shade, size)
+    except Exception:
+        return None
+
+def _with_formatted_ids(df_samples):
+    """
+    Samples with formatted '_rid' / '_shade' columns, keeping only the rows where
+    both the respondent ID and the shade name are valid
+    """
+    if df_samples.empty:
+        return df_samples.assign(_rid=None, _shade=None)
+    
+    df_samples = df_samples.assign(
+        _rid=df_samples['RESP_FINAL'].map(_format_respondent_id),
+        _shade=df_samples['VIDEOS'].map(_format_shade_name)
+    )
+    return df_samples[df_samples['_rid'].notna() & df_samples['_shade'].notna()]
+
+def _grid_thumbnails(keys, size):
+    """
+    Base64 thumbnails for distinct (respondent_id, shade) pairs
+    
+    Image loads and PIL resize/encode release the GIL, so the pairs are processed
+    concurrently; worker threads share the script context for cached loaders.
+    """
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return {}
+    
+    with ThreadPoolExecutor(max_workers=min(GALLERY_FETCH_WORKERS, len(keys)),
+                            initializer=add_script_run_ctx,
+                            initargs=(None, get_script_run_ctx())) as executor:
+        return dict(zip(keys, executor.map(lambda key: _grid_thumbnail_or_none(*key, size), keys)))
+
+def _thumbnail_px(display_px, max_px):
+    """Pixel size to encode a thumbnail shown display_px wide at: HiDPI pixel ratio, clipped"""
+    target_px = int(display_px * GRID_THUMBNAIL_PIXEL_RATIO)
+    return int(np.clip(target_px, GRID_THUMBNAIL_MIN_PX, max_px))
+
+def grid_thumbnail_size(size_l, L_bins):
+    """
+    Pixel size to encode grid thumbnails at: their on-screen height (image height in L
+    units over the L axis range, times the plot height) at HiDPI pixel ratio
+    """
+    L_range = max(L_bins) - min(L_bins)
+    if not L_range > 0:
+        return (GRID_THUMBNAIL_MAX_PX, GRID_THUMBNAIL_MAX_PX)
+    
+    target_px = _thumbnail_px(size_l / L_range * GRID_PLOT_HEIGHT_PX, GRID_THUMBNAIL_MAX_PX)
+    return (target_px, target_px)
+
+def gallery_thumbnail_size(cell_px):
+    """Pixel size to encode gallery thumbnails at: their cell width at HiDPI pixel ratio"""
+    target_px = _thumbnail_px(cell_px, GALLERY_THUMBNAIL_MAX_PX)
+    return (target_px, target_px)
+
 def create_grid_visualization_with_images(selected_data, region_num, color_type='main', 
-                                          image_size=(80, 80)):
+                                          image_size=None):
     """
     Create L-C and L-h grid visualizations with actual respondent images
     
@@ -36,7 +148,7 @@ def create_grid_visualization_with_images(selected_data, region_num, color_type=
     - selected_data: Dictionary from select_representative_samples_quantile
     - region_num: Region number
     - color_type: 'main' or 'reflect'
-    - image_size: Tuple for image dimensions
+    - image_size: Tuple for image dimensions (default: sized to the images on screen)
     
     Returns:
     - Plotly figure object
@@ -56,117 +168,110 @@ def create_grid_visualization_with_images(selected_data, region_num, color_type=
         horizontal_spacing=0.12
     )
     
-    # ===== PLOT 1: L vs C =====
-    for _, row in df_lc.iterrows():
-        respondent_id = format_respondent_id(row['RESP_FINAL'])
-        shade = format_shade_name(row['VIDEOS'])
+    # Image sizes in data units, computed once per subplot
+    sizex_lc = max(bins['C']) * 0.08  # Adjust size based on data range
+    sizey_l = max(bins['L']) * 0.08
+    sizex_lh = 360 * 0.08  # Hue is 0-360
+    
+    if image_size is None:
+        image_size = grid_thumbnail_size(sizey_l, bins['L'])
+    
+    # Respondent IDs and shade names formatted once per column; invalid rows are dropped
+    df_lc_ids = _with_formatted_ids(df_lc)
+    df_lh_ids = _with_formatted_ids(df_lh)
+    
+    # Load and encode every distinct thumbnail of both grids concurrently up front
+    thumbnails = _grid_thumbnails(
+        [*zip(df_lc_ids['_rid'], df_lc_ids['_shade']), *zip(df_lh_ids['_rid'], df_lh_ids['_shade'])],
+        image_size
+    )
+    
+    # Layout images and hover traces are collected and added in one call each:
+    # per-row add_layout_image / add_trace re-validate the whole tuple every time
+    images_list = []
+    
+    def grid_images_and_traces(df_samples, x_col, xref, yref, sizex):
+        """Layout image dicts and the hover scatter trace for one subplot's samples"""
+        if df_samples.empty:
+            return []
         
-        if respondent_id and shade:
-            # Load image
-            image = load_respondent_image(respondent_id, shade)
+        hover_x, hover_y, hover_texts = [], [], []
+        
+        # Plain column lists: no per-row Series allocation
+        columns = (df_samples[col].tolist() for col in ('_rid', '_shade', x_col, 'L', 'C', 'h'))
+        for respondent_id, shade, x_val, L_val, C_val, h_val in zip(*columns):
+            img_base64 = thumbnails.get((respondent_id, shade))
+            if not img_base64:
+                continue
+            
+            # Image placed at the sample's position
+            images_list.append(dict(
+                source=img_base64,
+                xref=xref, yref=yref,
+                x=x_val, y=L_val,
+                sizex=sizex,
+                sizey=sizey_l,
+                xanchor="center", yanchor="middle",
+                layer="above"
+            ))
             
-            if image:
-                # Convert to base64
-                img_base64 = pil_to_base64(image, image_size)
-                
-                if img_base64:
-                    # Add image as layout image
-                    fig.add_layout_image(
-                        dict(
-                            source=img_base64,
-                            xref="x", yref="y",
-                            x=row['C'], y=row['L'],
-                            sizex=max(bins['C']) * 0.08,  # Adjust size based on data range
-                            sizey=max(bins['L']) * 0.08,
-                            xanchor="center", yanchor="middle",
-                            layer="above"
-                        )
-                    )
-                    
-                    # Add invisible scatter point for hover info
-                    fig.add_trace(
-                        go.Scatter(
-                            x=[row['C']],
-                            y=[row['L']],
-                            mode='markers',
-                            marker=dict(size=1, opacity=0),
-                            hovertemplate=(
-                                f"<b>Respondent:</b> {respondent_id}<br>"
-                                f"<b>Shade:</b> {shade}<br>"
-                                f"<b>L:</b> {row['L']:.2f}<br>"
-                                f"<b>C:</b> {row['C']:.2f}<br>"
-                                f"<b>h:</b> {row['h']:.2f}°<br>"
-                                "<extra></extra>"
-                            ),
-                            showlegend=False,
-                            name=f"{respondent_id}_{shade}"
-                        ),
-                        row=1, col=1
-                    )
+            hover_x.append(x_val)
+            hover_y.append(L_val)
+            hover_texts.append(
+                f"<b>Respondent:</b> {respondent_id}<br>"
+                f"<b>Shade:</b> {shade}<br>"
+                f"<b>L:</b> {L_val:.2f}<br>"
+                f"<b>C:</b> {C_val:.2f}<br>"
+                f"<b>h:</b> {h_val:.2f}°<br>"
+            )
+        
+        if not hover_texts:
+            return []
+        
+        # One invisible scatter trace carries the hover info for every image in the subplot
+        return [go.Scatter(
+            x=hover_x,
+            y=hover_y,
+            mode='markers',
+            marker=dict(size=1, opacity=0),
+            hovertext=hover_texts,
+            hovertemplate="%{hovertext}<extra></extra>",
+            showlegend=False,
+            xaxis=xref, yaxis=yref
+        )]
+    
+    def grid_line_shapes(xref, yref, x_lines, y_lines):
+        """Dashed grid line shapes spanning one subplot (horizontal at y_lines, vertical at x_lines)"""
+        line_style = dict(type='line', line=dict(color='gray', dash='dash'), opacity=0.3)
+        return (
+            [dict(line_style, xref=f"{xref} domain", x0=0, x1=1, yref=yref, y0=y, y1=y) for y in y_lines] +
+            [dict(line_style, xref=xref, x0=x, x1=x, yref=f"{yref} domain", y0=0, y1=1) for x in x_lines]
+        )
+    
+    # Grid lines are collected and set in one update_layout call; like add_hline/add_vline,
+    # subplots without any samples get none
+    shapes_list = []
+    
+    # ===== PLOT 1: L vs C =====
+    traces_lc = grid_images_and_traces(df_lc_ids, 'C', "x", "y", sizex_lc)
+    fig.add_traces(traces_lc)
     
     # Add grid lines for L-C
-    for L_line in bins['L']:
-        fig.add_hline(y=L_line, line_dash="dash", line_color="gray", 
-                     opacity=0.3, row=1, col=1)
-    for C_line in bins['C']:
-        fig.add_vline(x=C_line, line_dash="dash", line_color="gray", 
-                     opacity=0.3, row=1, col=1)
+    if traces_lc:
+        shapes_list.extend(grid_line_shapes("x", "y", bins['C'], bins['L']))
     
     # ===== PLOT 2: L vs h =====
-    for _, row in df_lh.iterrows():
-        respondent_id = format_respondent_id(row['RESP_FINAL'])
-        shade = format_shade_name(row['VIDEOS'])
-        
-        if respondent_id and shade:
-            # Load image
-            image = load_respondent_image(respondent_id, shade)
-            
-            if image:
-                # Convert to base64
-                img_base64 = pil_to_base64(image, image_size)
-                
-                if img_base64:
-                    # Add image as layout image
-                    fig.add_layout_image(
-                        dict(
-                            source=img_base64,
-                            xref="x2", yref="y2",
-                            x=row['h'], y=row['L'],
-                            sizex=360 * 0.08,  # Hue is 0-360
-                            sizey=max(bins['L']) * 0.08,
-                            xanchor="center", yanchor="middle",
-                            layer="above"
-                        )
-                    )
-                    
-                    # Add invisible scatter point for hover info
-                    fig.add_trace(
-                        go.Scatter(
-                            x=[row['h']],
-                            y=[row['L']],
-                            mode='markers',
-                            marker=dict(size=1, opacity=0),
-                            hovertemplate=(
-                                f"<b>Respondent:</b> {respondent_id}<br>"
-                                f"<b>Shade:</b> {shade}<br>"
-                                f"<b>L:</b> {row['L']:.2f}<br>"
-                                f"<b>C:</b> {row['C']:.2f}<br>"
-                                f"<b>h:</b> {row['h']:.2f}°<br>"
-                                "<extra></extra>"
-                            ),
-                            showlegend=False,
-                            name=f"{respondent_id}_{shade}"
-                        ),
-                        row=1, col=2
-                    )
+    traces_lh = grid_images_and_traces(df_lh_ids, 'h', "x2", "y2", sizex_lh)
+    fig.add_traces(traces_lh)
     
     # Add grid lines for L-h
-    for L_line in bins['L']:
-        fig.add_hline(y=L_line, line_dash="dash", line_color="gray", 
-                     opacity=0.3, row=1, col=2)
-    for h_line in bins['h']:
-        fig.add_vline(x=h_line, line_dash="dash", line_color="gray", 
-                     opacity=0.3, row=1, col=2)
+    if traces_lh:
+        shapes_list.extend(grid_line_shapes("x2", "y2", bins['h'], bins['L']))
+    
+    if shapes_list:
+        fig.update_layout(shapes=shapes_list)
+    if images_list:
+        fig.update_layout(images=images_list)
     
     # Update axes
     fig.update_xaxes(title_text="Chroma (C)", row=1, col=1)
@@ -180,7 +285,7 @@ def create_grid_visualization_with_images(selected_data, region_num, color_type=
         title_text=f"Region {region_num} - Quantile-Based Grid Analysis ({color_type} color)",
         title_font_size=18,
         showlegend=False,
-        height=600,
+        height=GRID_FIGURE_HEIGHT,
         hovermode='closest',
         plot_bgcolor='white',
         paper_bgcolor='white'
@@ -193,47 +298,106 @@ def create_grid_visualization_with_images(selected_data, region_num, color_type=
     return fig
 
 
-def load_images_for_gallery(df_samples):
+@st.cache_data(ttl=GCS_CACHE_TTL, max_entries=512, show_spinner=False)
+def _load_gallery_image(respondent_id, shade, size):
+    """
+    Load one respondent image as a base64 JPEG data URI thumbnail
+    
+    Cached per (respondent_id, shade, size), so the L-C and L-h galleries share
+    loads for samples that appear in both grids. st.image passes data URIs
+    straight through, so reruns skip the PIL decode/re-encode it does on bytes.
+    A missing or unreadable image is cached as None; GCS/network errors are
+    raised rather than cached, so the tile is retried on the next render.
+    """
+    image = load_respondent_image(respondent_id, shade, raise_errors=True)
+    if image is None:
+        return None
+    
+    try:
+        # Photos compress far better as JPEG than PNG at thumbnail size
+        thumbnail = image.convert("RGB")
+        thumbnail.thumbnail(size, Image.Resampling.BILINEAR)
+        buffered = BytesIO()
+        thumbnail.save(buffered, format="JPEG", quality=82)
+        return _data_uri(buffered, "image/jpeg")
+    except Exception as e:
+        logger.error(f"Error encoding gallery image for {respondent_id} - {shade}: {e}")
+        return None
+
+def _gallery_image_or_none(respondent_id, shade, size):
+    """Gallery thumbnail data URI, or None if there is no image or it could not be loaded"""
+    try:
+        return _load_gallery_image(respondent_id, shade, size)
+    except Exception:
+        return None
+
+def _gallery_image_info(row, respondent_id, shade, image):
+    """Gallery display info for one sample row and its loaded thumbnail (None if no image)"""
+    if not image:
+        logger.warning(f"Could not load image for {respondent_id} - {shade}")
+        return None
+    
+    img_data = {
+        'image': image,
+        'respondent_id': respondent_id,
+        'shade': shade,
+        'L': row['L'],
+        'C': row['C'],
+        'h': row['h']
+    }
+    
+    # Add bin information if available
+    if 'L_bin' in row:
+        img_data['L_bin'] = int(row['L_bin'])
+    if 'C_bin' in row:
+        img_data['C_bin'] = int(row['C_bin'])
+    if 'L_bin_h' in row:
+        img_data['L_bin_h'] = int(row['L_bin_h'])
+    if 'h_bin' in row:
+        img_data['h_bin'] = int(row['h_bin'])
+    
+    return img_data
+
+def _gallery_images_info(rows, size):
+    """
+    Load gallery thumbnails and display info for sample rows
+    
+    Each distinct (respondent_id, shade) pair is loaded once, with the pairs fetched
+    concurrently. Results are returned in the order of rows (None where no image was
+    found). Worker threads share the script context so the cached loader behaves as
+    if called from the script thread.
     """
-    Load all images for gallery display
+    rows = list(rows)
+    keys = [(_format_respondent_id(row['RESP_FINAL']), _format_shade_name(row['VIDEOS'])) for row in rows]
+    
+    unique_keys = list(dict.fromkeys(key for key in keys if key[0] and key[1]))
+    images = {}
+    if unique_keys:
+        with ThreadPoolExecutor(max_workers=min(GALLERY_FETCH_WORKERS, len(unique_keys)),
+                                initializer=add_script_run_ctx,
+                                initargs=(None, get_script_run_ctx())) as executor:
+            images = dict(zip(unique_keys, executor.map(lambda key: _gallery_image_or_none(*key, size), unique_keys)))
+    
+    return [
+        _gallery_image_info(row, respondent_id, shade, images[(respondent_id, shade)])
+        if respondent_id and shade else None
+        for row, (respondent_id, shade) in zip(rows, keys)
+    ]
+
+def load_grid_images_for_gallery(grid, size):
+    """
+    Load gallery images for samples already indexed by grid cell
     
     Parameters:
-    - df_samples: DataFrame with RESP_FINAL, VIDEOS, and bin columns
+    - grid: Dictionary (row bin, column bin) -> sample, as 'lc_grid' / 'lh_grid'
+      from select_representative_samples_quantile
+    - size: Bounding box for the thumbnails (aspect ratio is preserved), from
+      gallery_thumbnail_size for the gallery's cell width
     
     Returns:
-    - List of dictionaries with image info including bin positions
+    - Dictionary (row bin, column bin) -> image info (cells without an image are omitted)
     """
-    images_info = []
+    cells = list(grid)
+    images_info = _gallery_images_info((grid[cell] for cell in cells), size)
     
-    for idx, row in df_samples.iterrows():
-        respondent_id = format_respondent_id(row['RESP_FINAL'])
-        shade = format_shade_name(row['VIDEOS'])
-        
-        if respondent_id and shade:
-            image = load_respondent_image(respondent_id, shade)
-            
-            if image:
-                img_data = {
-                    'image': image,
-                    'respondent_id': respondent_id,
-                    'shade': shade,
-                    'L': row['L'],
-                    'C': row['C'],
-                    'h': row['h']
-                }
-                
-                # Add bin information if available
-                if 'L_bin' in row:
-                    img_data['L_bin'] = int(row['L_bin'])
-                if 'C_bin' in row:
-                    img_data['C_bin'] = int(row['C_bin'])
-                if 'L_bin_h' in row:
-                    img_data['L_bin_h'] = int(row['L_bin_h'])
-                if 'h_bin' in row:
-                    img_data['h_bin'] = int(row['h_bin'])
-                
-                images_info.append(img_data)
-            else:
-                logger.warning(f"Could not load image for {respondent_id} - {shade}")
-    
-    return images_info
\ No newline at end of file
+    return {cell: img_data for cell, img_data in zip(cells, images_info) if img_data}
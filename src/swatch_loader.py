@@ -1,13 +1,48 @@
 """Swatch loading utilities for hair color analysis with category-based mapping"""
+import logging
 import pandas as pd
 import os
-from PIL import Image
+from collections import defaultdict
+import streamlit as st
 from config.settings import SHADES_MAPPING_CSV_PATH, HAIR_CATEGORY_CSV_PATH, SWATCHES_BASE_PATH, logger
-from src.gcp_client import get_image_from_gcs
+from src.gcp_client import TRANSIENT_GCS_ERRORS, get_image_from_gcs
 
-# Cache for CSV files to avoid reloading
-_shades_mapping_cache = None
-_hair_category_cache = None
+# Column names accepted in the hair category CSV, in priority order
+RESPONDENT_ID_COLUMNS = ['RESP_FINAL', 'Respondent ID', 'respondent_id', 'filename', 'id']
+CATEGORY_COLUMNS = ['CATEGORY', 'Category', 'category']
+A1R_COLUMNS = ['A1R', 'a1r', 'A1r', 'skin_tone_cluster']
+
+# Column names that might contain the shade ID in color data, in priority order
+SHADE_ID_COLUMNS = ['shade', 'shade_id', 'id', 'XSHADES', 'id_x']
+
+# Mapping CSVs are static reference data: they are loaded once per process with
+# st.cache_resource and shared (read-only) across sessions. Swatch name lookups are
+# st.cache_resource entries on top of them; reload_mappings() clears all of it. Swatch
+# images are not memoized here, so a transient GCS failure is not remembered.
+# A failed load is not cached, so a missing file is picked up as soon as it appears.
+
+# Load errors already reported, so a file that stays missing is only logged once
+_reported_load_errors = set()
+
+def _read_local_csv(csv_path: str) -> pd.DataFrame:
+    """
+    Read a local mapping CSV, with the separator picked from the header line
+    
+    The parsed frame is kept in memory by the cached loaders, once per process.
+    """
+    with open(csv_path, 'rb') as f:
+        header = f.readline()
+    sep = ';' if header.count(b';') > header.count(b',') else ','
+    df = pd.read_csv(csv_path, sep=sep)
+    logger.info(f"Parsed {csv_path} with {'semicolon' if sep == ';' else 'comma'} separator")
+    
+    return df
+
+def _report_load_error(message: str):
+    """Log a mapping load error the first time it occurs"""
+    if message not in _reported_load_errors:
+        _reported_load_errors.add(message)
+        logger.error(message)
 
 def load_shades_mapping() -> pd.DataFrame:
     """
@@ -15,92 +50,164 @@ def load_shades_mapping() -> pd.DataFrame:
     
     Returns:
         pd.DataFrame: Shades mapping data with columns Number_light, Number_medium, Number_dark, Name_gcp_with_numberbyL
+        (empty if the file cannot be loaded; the load is retried on the next call)
     """
-    global _shades_mapping_cache
+    try:
+        return _load_shades_mapping()
+    except FileNotFoundError:
+        _report_load_error(f"Shades mapping CSV not found at: {SHADES_MAPPING_CSV_PATH}")
+    except Exception as e:
+        _report_load_error(f"Error loading shades mapping: {str(e)}")
+    return pd.DataFrame()
+
+@st.cache_resource(show_spinner=False)
+def _load_shades_mapping() -> pd.DataFrame:
+    """Parsed shades mapping, cached once loaded (errors propagate and are not cached)"""
+    shades_df = _read_local_csv(SHADES_MAPPING_CSV_PATH)
     
-    if _shades_mapping_cache is None:
-        try:
-            if not os.path.exists(SHADES_MAPPING_CSV_PATH):
-                logger.error(f"Shades mapping CSV not found at: {SHADES_MAPPING_CSV_PATH}")
-                _shades_mapping_cache = pd.DataFrame()
-                return _shades_mapping_cache
-            
-            # Try both comma and semicolon separators
-            try:
-                _shades_mapping_cache = pd.read_csv(SHADES_MAPPING_CSV_PATH, sep=',')
-            except:
-                _shades_mapping_cache = pd.read_csv(SHADES_MAPPING_CSV_PATH, sep=';')
-            
-            logger.info(f"Loaded shades mapping from local file with {len(_shades_mapping_cache)} entries")
-            
-            # Log sample entries for debugging
-            if not _shades_mapping_cache.empty:
-                logger.info("Sample shades mapping entries:")
-                for idx, row in _shades_mapping_cache.head(3).iterrows():
-                    logger.info(f"  Name: {row['Name_gcp_with_numberbyL']}")
-                    logger.info(f"    Light: {row.get('Number_light', 'N/A')}, Medium: {row.get('Number_medium', 'N/A')}, Dark: {row.get('Number_dark', 'N/A')}")
-            
-        except Exception as e:
-            logger.error(f"Error loading shades mapping: {str(e)}")
-            _shades_mapping_cache = pd.DataFrame()
+    logger.info(f"Loaded shades mapping from local file with {len(shades_df)} entries")
+    
+    # Log sample entries for debugging
+    if not shades_df.empty:
+        logger.info("Sample shades mapping entries:")
+        for idx, row in shades_df.head(3).iterrows():
+            logger.info(f"  Name: {row['Name_gcp_with_numberbyL']}")
+            logger.info(f"    Light: {row.get('Number_light', 'N/A')}, Medium: {row.get('Number_medium', 'N/A')}, Dark: {row.get('Number_dark', 'N/A')}")
     
-    return _shades_mapping_cache
+    return shades_df
 
 def load_hair_category() -> pd.DataFrame:
     """
     Load the hair category CSV from local file with caching
-    Supports both comma and semicolon separators
+    Supports both comma and semicolon separators (picked from the header line)
     
     Returns:
         pd.DataFrame: Hair category data with RESP_FINAL and CATEGORY columns
+        (empty if the file cannot be loaded; the load is retried on the next call)
     """
-    global _hair_category_cache
+    try:
+        return _load_hair_category()
+    except FileNotFoundError:
+        _report_load_error(f"Hair category CSV not found at: {HAIR_CATEGORY_CSV_PATH}")
+    except Exception as e:
+        _report_load_error(f"Error loading hair category mapping: {str(e)}")
+    return pd.DataFrame()
+
+@st.cache_resource(show_spinner=False)
+def _load_hair_category() -> pd.DataFrame:
+    """Parsed hair category mapping, cached once loaded (errors propagate and are not cached)"""
+    category_df = _read_local_csv(HAIR_CATEGORY_CSV_PATH)
     
-    if _hair_category_cache is None:
-        try:
-            if not os.path.exists(HAIR_CATEGORY_CSV_PATH):
-                logger.error(f"Hair category CSV not found at: {HAIR_CATEGORY_CSV_PATH}")
-                _hair_category_cache = pd.DataFrame()
-                return _hair_category_cache
-            
-            # Try semicolon separator first (based on your format), then comma
-            try:
-                _hair_category_cache = pd.read_csv(HAIR_CATEGORY_CSV_PATH, sep=';')
-                logger.info("Loaded hair category CSV with semicolon separator")
-            except:
-                _hair_category_cache = pd.read_csv(HAIR_CATEGORY_CSV_PATH, sep=',')
-                logger.info("Loaded hair category CSV with comma separator")
+    logger.info(f"Loaded hair category mapping with {len(category_df)} entries")
+    
+    # Log sample entries for debugging
+    if not category_df.empty:
+        logger.info("Sample hair category entries:")
+        logger.info(f"Columns found: {category_df.columns.tolist()}")
+        for idx, row in category_df.head(3).iterrows():
+            # Handle different possible column names
+            resp_id = None
+            category = None
             
-            logger.info(f"Loaded hair category mapping with {len(_hair_category_cache)} entries")
+            # Try different column names for respondent ID
+            for col in RESPONDENT_ID_COLUMNS:
+                if col in row:
+                    resp_id = row[col]
+                    break
             
-            # Log sample entries for debugging
-            if not _hair_category_cache.empty:
-                logger.info("Sample hair category entries:")
-                logger.info(f"Columns found: {_hair_category_cache.columns.tolist()}")
-                for idx, row in _hair_category_cache.head(3).iterrows():
-                    # Handle different possible column names
-                    resp_id = None
-                    category = None
-                    
-                    # Try different column names for respondent ID
-                    for col in ['RESP_FINAL', 'Respondent ID', 'respondent_id', 'filename', 'id']:
-                        if col in row:
-                            resp_id = row[col]
-                            break
-                    
-                    # Try different column names for category
-                    for col in ['CATEGORY', 'Category', 'category']:
-                        if col in row:
-                            category = row[col]
-                            break
-                    
-                    logger.info(f"  {resp_id} -> {category}")
+            # Try different column names for category
+            for col in CATEGORY_COLUMNS:
+                if col in row:
+                    category = row[col]
+                    break
             
-        except Exception as e:
-            logger.error(f"Error loading hair category mapping: {str(e)}")
-            _hair_category_cache = pd.DataFrame()
+            logger.info(f"  {resp_id} -> {category}")
     
-    return _hair_category_cache
+    return category_df
+
+@st.cache_resource(show_spinner=False)
+def _hair_category_columns() -> dict:
+    """
+    Resolve which of the accepted column names the loaded hair category CSV actually has
+    
+    Returns:
+        dict: 'id', 'category' and 'a1r' -> list of the present columns, in priority order
+    """
+    columns = set(_load_hair_category().columns)
+    return {
+        'id': [col for col in RESPONDENT_ID_COLUMNS if col in columns],
+        'category': [col for col in CATEGORY_COLUMNS if col in columns],
+        'a1r': [col for col in A1R_COLUMNS if col in columns]
+    }
+
+@st.cache_resource(show_spinner=False)
+def _hair_category_index() -> list:
+    """
+    Exact-match and partial-match indexes over the hair category mapping, built once per load
+    
+    Returns:
+        list: One (id column, {stripped ID: first row position}, list of ID strings,
+        {trigram: row positions}) entry per respondent ID column present, in lookup priority order
+    """
+    category_df = _load_hair_category()
+    
+    index = []
+    for id_col in _hair_category_columns()['id']:
+        id_strings = category_df[id_col].astype(str).tolist()
+        keys = [id_string.strip() for id_string in id_strings]
+        # Built from the last row backwards so each ID keeps its first row, like iloc[0] on a scan
+        positions = dict(zip(reversed(keys), range(len(keys) - 1, -1, -1)))
+        index.append((id_col, positions, id_strings, _trigram_index(id_strings)))
+    
+    return index
+
+def _trigram_index(strings: list) -> dict:
+    """Posting sets {3-character substring: positions of the strings containing it}"""
+    trigrams = defaultdict(set)
+    for pos, string in enumerate(strings):
+        for start in range(len(string) - 2):
+            trigrams[string[start:start + 3]].add(pos)
+    return dict(trigrams)
+
+def _find_substring_position(query: str, strings: list, trigrams: dict):
+    """
+    Position of the first string containing query, or None
+    
+    Only the strings holding every trigram of the query are checked; queries shorter
+    than a trigram fall back to a scan.
+    """
+    if len(query) < 3:
+        return next((pos for pos, string in enumerate(strings) if query in string), None)
+    
+    postings = [trigrams.get(query[start:start + 3]) for start in range(len(query) - 2)]
+    if not all(postings):
+        return None
+    
+    candidates = set.intersection(*postings)
+    return min((pos for pos in candidates if query in strings[pos]), default=None)
+
+def _find_respondent_row(respondent_id_str: str) -> tuple:
+    """
+    First hair category row for a respondent: an exact ID match from the index, else a
+    partial match (respondent ID contained in e.g. a filename), per ID column in priority order
+    
+    Returns:
+        tuple: (row Series, id column, partial match flag) or (None, None, False) if not found
+    """
+    category_df = load_hair_category()
+    
+    for id_col, positions, id_strings, trigrams in _hair_category_index():
+        position = positions.get(respondent_id_str)
+        if position is not None:
+            return category_df.iloc[position], id_col, False
+        
+        # Try partial match (if respondent_id is part of filename); only reached on an exact miss.
+        # Substring test on the ID strings sharing the query's trigrams, without a full scan
+        position = _find_substring_position(respondent_id_str, id_strings, trigrams)
+        if position is not None:
+            return category_df.iloc[position], id_col, True
+    
+    return None, None, False
 
 def get_category_for_respondent(respondent_id: str) -> str:
     """
@@ -118,55 +225,58 @@ def get_category_for_respondent(respondent_id: str) -> str:
         logger.warning("Hair category mapping not available")
         return None
     
-    # Try different column names for respondent ID (prioritize RESP_FINAL)
-    possible_id_columns = ['RESP_FINAL', 'Respondent ID', 'respondent_id', 'filename', 'id']
-    # Try different column names for category
-    possible_category_columns = ['CATEGORY', 'Category', 'category']
-    
     respondent_id_str = str(respondent_id).strip()
     
-    for id_col in possible_id_columns:
-        if id_col in category_df.columns:
-            # Try exact match
-            matching_rows = category_df[category_df[id_col].astype(str).str.strip() == respondent_id_str]
-            
-            if not matching_rows.empty:
-                # Find the category column
-                category = None
-                for cat_col in possible_category_columns:
-                    if cat_col in matching_rows.columns:
-                        category = matching_rows.iloc[0][cat_col].lower().strip()
-                        logger.info(f"Found category for respondent {respondent_id}: {category} (using columns {id_col} -> {cat_col})")
-                        return category
-                
-                if category is None:
-                    logger.error(f"Found respondent {respondent_id} but no category column found")
-                    return None
-            
-            # Try partial match (if respondent_id is part of filename)
-            partial_matches = category_df[category_df[id_col].astype(str).str.contains(respondent_id_str, na=False)]
-            
-            if not partial_matches.empty:
-                # Find the category column
-                category = None
-                for cat_col in possible_category_columns:
-                    if cat_col in partial_matches.columns:
-                        category = partial_matches.iloc[0][cat_col].lower().strip()
-                        logger.info(f"Found category for respondent {respondent_id} (partial match): {category}")
-                        return category
-    
-    logger.warning(f"No category found for respondent ID: {respondent_id}")
-    
-    # Log available respondent IDs for debugging
-    if not category_df.empty:
-        for id_col in possible_id_columns:
-            if id_col in category_df.columns:
-                available_ids = category_df[id_col].head(10).tolist()
-                logger.debug(f"Available respondent IDs in column '{id_col}' (first 10): {available_ids}")
-                break
+    row, id_col, partial = _find_respondent_row(respondent_id_str)
+    
+    if row is not None:
+        category_columns = _hair_category_columns()['category']
+        if not category_columns:
+            logger.error("Found respondent %s but no category column found", respondent_id)
+            return None
+        
+        cat_col = category_columns[0]
+        category = row[cat_col].lower().strip()
+        if partial:
+            logger.info("Found category for respondent %s (partial match): %s", respondent_id, category)
+        else:
+            logger.info("Found category for respondent %s: %s (using columns %s -> %s)", respondent_id, category, id_col, cat_col)
+        return category
+    
+    logger.warning("No category found for respondent ID: %s", respondent_id)
+    
+    # Log available respondent IDs for debugging (skipped entirely when DEBUG is off)
+    if logger.isEnabledFor(logging.DEBUG):
+        for id_col, _, _, _ in _hair_category_index()[:1]:
+            available_ids = category_df[id_col].head(10).tolist()
+            logger.debug("Available respondent IDs in column '%s' (first 10): %s", id_col, available_ids)
     
     return None
 
+@st.cache_resource(show_spinner=False)
+def _swatch_name_index() -> dict:
+    """
+    Swatch name lookups over the shades mapping, built once per load
+    
+    Returns:
+        dict: number column -> ({number: swatch name}, {stripped number string: swatch name}),
+        each keeping the first matching row
+    """
+    mapping_df = _load_shades_mapping()
+    
+    index = {}
+    for number_column in ['Number_dark', 'Number_medium', 'Number_light']:
+        if number_column in mapping_df.columns:
+            numbers = mapping_df[number_column]
+            names = mapping_df['Name_gcp_with_numberbyL'].tolist()
+            valid = numbers.notna().to_numpy()
+            # Reversed so that the first row wins for repeated numbers
+            by_number = dict(zip(reversed(numbers[valid].tolist()), reversed([n for n, v in zip(names, valid) if v])))
+            by_string = dict(zip(reversed(numbers.astype(str).str.strip().tolist()), reversed(names)))
+            index[number_column] = (by_number, by_string)
+    
+    return index
+
 def get_swatch_name_for_shade_and_category(shade_id: str, category: str) -> str:
     """
     Get the swatch name for a given shade ID and category
@@ -178,12 +288,22 @@ def get_swatch_name_for_shade_and_category(shade_id: str, category: str) -> str:
     Returns:
         str: Swatch name prefix or None if not found
     """
-    mapping_df = load_shades_mapping()
-    
-    if mapping_df.empty:
+    if load_shades_mapping().empty:
         logger.warning("Shades mapping not available")
         return None
     
+    return _get_swatch_name_for_shade_and_category(shade_id, category)
+
+@st.cache_resource(max_entries=4096, show_spinner=False)
+def _get_swatch_name_for_shade_and_category(shade_id: str, category: str) -> str:
+    """
+    Cached lookup behind get_swatch_name_for_shade_and_category, once the mapping is loaded
+    
+    A Streamlit cache like the mapping it reads, so reload_mappings() and
+    st.cache_resource.clear() reset both together.
+    """
+    mapping_df = _load_shades_mapping()
+    
     # Determine which column to search based on category
     category_lower = category.lower().strip()
     if category_lower == 'dark':
@@ -193,43 +313,45 @@ def get_swatch_name_for_shade_and_category(shade_id: str, category: str) -> str:
     elif category_lower == 'light':
         number_column = 'Number_light'
     else:
-        logger.error(f"Invalid category: {category}. Must be dark, medium, or light")
+        logger.error("Invalid category: %s. Must be dark, medium, or light", category)
         return None
     
     # Convert shade_id to different types for matching
     shade_id_str = str(shade_id).strip()
     
+    by_number, by_string = _swatch_name_index()[number_column]
+    
     try:
         shade_id_int = int(shade_id_str)
         
-        # Look for rows where the number_column matches the shade_id
-        matching_rows = mapping_df[mapping_df[number_column] == shade_id_int]
+        # Look for the row where the number_column matches the shade_id
+        swatch_name = by_number.get(shade_id_int)
         
-        if not matching_rows.empty:
-            swatch_name = matching_rows.iloc[0]['Name_gcp_with_numberbyL']
-            logger.info(f"Found swatch name for shade {shade_id} in category {category}: {swatch_name}")
+        if swatch_name is not None:
+            logger.info("Found swatch name for shade %s in category %s: %s", shade_id, category, swatch_name)
             return swatch_name
         
     except ValueError:
-        logger.warning(f"Could not convert shade_id '{shade_id}' to integer for matching")
+        logger.warning("Could not convert shade_id '%s' to integer for matching", shade_id)
     
     # Try string matching as fallback
-    matching_rows = mapping_df[mapping_df[number_column].astype(str).str.strip() == shade_id_str]
+    swatch_name = by_string.get(shade_id_str)
     
-    if not matching_rows.empty:
-        swatch_name = matching_rows.iloc[0]['Name_gcp_with_numberbyL']
-        logger.info(f"Found swatch name for shade {shade_id} in category {category} (string match): {swatch_name}")
+    if swatch_name is not None:
+        logger.info("Found swatch name for shade %s in category %s (string match): %s", shade_id, category, swatch_name)
         return swatch_name
     
-    logger.warning(f"No swatch mapping found for shade ID {shade_id} in category {category}")
+    logger.warning("No swatch mapping found for shade ID %s in category %s", shade_id, category)
     
-    # Log available numbers in that category for debugging
-    available_numbers = mapping_df[mapping_df[number_column].notna()][number_column].head(10).tolist()
-    logger.debug(f"Available {category} numbers (first 10): {available_numbers}")
+    # Log available numbers in that category for debugging (skipped entirely when DEBUG is off)
+    if logger.isEnabledFor(logging.DEBUG):
+        available_numbers = mapping_df[number_column].dropna().head(10).tolist()
+        logger.debug("Available %s numbers (first 10): %s", category, available_numbers)
     
     return None
 
-def load_swatch_from_category_folder(swatch_name: str, category: str, swatch_id: str) -> tuple:
+def load_swatch_from_category_folder(swatch_name: str, category: str, swatch_id: str,
+                                     raise_errors: bool = False) -> tuple:
     """
     Load swatch image from the specific category folder
     
@@ -237,6 +359,8 @@ def load_swatch_from_category_folder(swatch_name: str, category: str, swatch_id:
         swatch_name (str): Swatch name prefix
         category (str): Category (dark/medium/light)
         swatch_id (str): Swatch ID to include in filename
+        raise_errors (bool): Re-raise GCS/network errors instead of returning (None, None)
+            (a missing swatch still gives (None, None))
         
     Returns:
         tuple: (PIL.Image, swatch_info_dict) or (None, None) if not found
@@ -248,7 +372,7 @@ def load_swatch_from_category_folder(swatch_name: str, category: str, swatch_id:
     swatch_path = f"{SWATCHES_BASE_PATH}/{category_lower}/{swatch_id}_{swatch_filename}"
     
     try:
-        swatch_image = get_image_from_gcs(swatch_path)
+        swatch_image = get_image_from_gcs(swatch_path, raise_errors=raise_errors)
         
         if swatch_image:
             swatch_info = {
@@ -260,22 +384,26 @@ def load_swatch_from_category_folder(swatch_name: str, category: str, swatch_id:
                 'swatch_id': swatch_id
             }
             
-            logger.info(f"Successfully loaded swatch from {category_lower} folder: {swatch_path}")
+            logger.info("Successfully loaded swatch from %s folder: %s", category_lower, swatch_path)
             return swatch_image, swatch_info
         
     except Exception as e:
-        logger.error(f"Error loading swatch from {swatch_path}: {str(e)}")
+        logger.error("Error loading swatch from %s: %s", swatch_path, e)
+        if raise_errors and isinstance(e, TRANSIENT_GCS_ERRORS):
+            raise
     
-    logger.warning(f"Swatch not found: {swatch_path}")
+    logger.warning("Swatch not found: %s", swatch_path)
     return None, None
 
-def load_swatch_for_respondent_and_shade(respondent_id: str, shade_id: str) -> tuple:
+def load_swatch_for_respondent_and_shade(respondent_id: str, shade_id: str, raise_errors: bool = False) -> tuple:
     """
     Load swatch image for a given respondent ID and shade ID using the two-step mapping
     
     Args:
         respondent_id (str): The respondent ID
         shade_id (str): The shade ID
+        raise_errors (bool): Re-raise GCS/network errors instead of returning (None, None)
+            (a missing swatch still gives (None, None))
         
     Returns:
         tuple: (PIL.Image, swatch_info_dict) or (None, None) if not found
@@ -284,18 +412,19 @@ def load_swatch_for_respondent_and_shade(respondent_id: str, shade_id: str) -> t
     category = get_category_for_respondent(respondent_id)
     
     if not category:
-        logger.warning(f"Could not determine category for respondent {respondent_id}")
+        logger.warning("Could not determine category for respondent %s", respondent_id)
         return None, None
     
     # Step 2: Get swatch name for shade and category
     swatch_name = get_swatch_name_for_shade_and_category(shade_id, category)
     
     if not swatch_name:
-        logger.warning(f"Could not find swatch name for shade {shade_id} in category {category}")
+        logger.warning("Could not find swatch name for shade %s in category %s", shade_id, category)
         return None, None
     
     # Step 3: Load swatch from the appropriate folder with swatch_id in filename
-    swatch_image, swatch_info = load_swatch_from_category_folder(swatch_name, category, shade_id)
+    swatch_image, swatch_info = load_swatch_from_category_folder(swatch_name, category, shade_id,
+                                                                 raise_errors=raise_errors)
     
     if swatch_image and swatch_info:
         # Add extra info about the mapping process
@@ -303,7 +432,7 @@ def load_swatch_for_respondent_and_shade(respondent_id: str, shade_id: str) -> t
         swatch_info['shade_id'] = shade_id
         swatch_info['mapping_category'] = category
         
-        logger.info(f"Successfully loaded swatch for respondent {respondent_id}, shade {shade_id}: {swatch_name}")
+        logger.info("Successfully loaded swatch for respondent %s, shade %s: %s", respondent_id, shade_id, swatch_name)
         return swatch_image, swatch_info
     
     return None, None
@@ -318,20 +447,22 @@ def extract_shade_id_from_data(df: pd.DataFrame) -> str:
     Returns:
         str: Shade ID if found, None otherwise
     """
-    # Look for common column names that might contain the shade ID
-    possible_columns = ['shade', 'shade_id', 'id', 'XSHADES', 'id_x']
-    
-    for col in possible_columns:
-        if col in df.columns:
-            # Get the first non-null value
-            shade_values = df[col].dropna().unique()
-            if len(shade_values) > 0:
-                shade_id = str(shade_values[0])
-                logger.info(f"Found shade ID '{shade_id}' in column '{col}'")
-                return shade_id
+    # Only the shade ID columns the frame actually has, in priority order
+    df_columns = set(df.columns)
+    present_columns = [col for col in SHADE_ID_COLUMNS if col in df_columns]
+    
+    for col in present_columns:
+        # Get the first non-null value (by position, without building the unique values)
+        shade_values = df[col]
+        valid = shade_values.notna().to_numpy()
+        if valid.any():
+            shade_id = str(shade_values.iloc[valid.argmax()])
+            logger.info("Found shade ID '%s' in column '%s'", shade_id, col)
+            return shade_id
     
     logger.warning("No shade ID found in data")
-    logger.debug(f"Available columns: {df.columns.tolist()}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Available columns: %s", df.columns.tolist())
     
     return None
 
@@ -339,9 +470,13 @@ def reload_mappings():
     """
     Force reload of both mapping CSV files (useful for testing)
     """
-    global _shades_mapping_cache, _hair_category_cache
-    _shades_mapping_cache = None
-    _hair_category_cache = None
+    _load_shades_mapping.clear()
+    _load_hair_category.clear()
+    _reported_load_errors.clear()
+    _hair_category_columns.clear()
+    _hair_category_index.clear()
+    _swatch_name_index.clear()
+    _get_swatch_name_for_shade_and_category.clear()
     
     shades_df = load_shades_mapping()
     category_df = load_hair_category()
@@ -382,7 +517,7 @@ def get_mapping_info() -> dict:
                 'medium': row.get('Number_medium', 'N/A'),
                 'dark': row.get('Number_dark', 'N/A')
             }
-            for _, row in shades_df.head(3).iterrows()
+            for row in shades_df.head(3).to_dict('records')
         ]
     
     # Hair category info
@@ -391,25 +526,11 @@ def get_mapping_info() -> dict:
         info['hair_category']['total_entries'] = len(category_df)
         info['hair_category']['columns'] = category_df.columns.tolist()
         
-        # Find the correct column names
-        resp_col = None
-        cat_col = None
-        a1r_col = None
-        
-        for col in ['RESP_FINAL', 'Respondent ID', 'respondent_id', 'filename', 'id']:
-            if col in category_df.columns:
-                resp_col = col
-                break
-        
-        for col in ['CATEGORY', 'Category', 'category']:
-            if col in category_df.columns:
-                cat_col = col
-                break
-                
-        for col in ['A1R', 'a1r', 'A1r', 'skin_tone_cluster']:
-            if col in category_df.columns:
-                a1r_col = col
-                break
+        # The column names resolved for this CSV
+        columns = _hair_category_columns()
+        resp_col = next(iter(columns['id']), None)
+        cat_col = next(iter(columns['category']), None)
+        a1r_col = next(iter(columns['a1r']), None)
         
         if resp_col and cat_col:
             info['hair_category']['sample_entries'] = [
@@ -418,7 +539,7 @@ def get_mapping_info() -> dict:
                     'category': row[cat_col],
                     'skin_tone_cluster': row.get(a1r_col, 'N/A') if a1r_col else 'N/A'
                 }
-                for _, row in category_df.head(3).iterrows()
+                for row in category_df.head(3).to_dict('records')
             ]
     
     return info
@@ -446,60 +567,31 @@ def get_respondent_info(respondent_id: str) -> dict:
         logger.warning("Hair category mapping not available")
         return result
     
-    # Try different column names for respondent ID
-    possible_id_columns = ['RESP_FINAL', 'Respondent ID', 'respondent_id', 'filename', 'id']
-    # Try different column names for category (hair tone)
-    possible_category_columns = ['CATEGORY', 'Category', 'category']
-    # Try different column names for A1R (skin tone cluster)
-    possible_a1r_columns = ['A1R', 'a1r', 'A1r', 'skin_tone_cluster']
-    
     respondent_id_str = str(respondent_id).strip()
     
-    for id_col in possible_id_columns:
-        if id_col in category_df.columns:
-            # Try exact match
-            matching_rows = category_df[category_df[id_col].astype(str).str.strip() == respondent_id_str]
-            
-            if not matching_rows.empty:
-                row = matching_rows.iloc[0]
-                result['found'] = True
-                
-                # Get hair tone (category)
-                for cat_col in possible_category_columns:
-                    if cat_col in row and pd.notna(row[cat_col]):
-                        result['hair_tone'] = str(row[cat_col]).strip().title()
-                        break
-                
-                # Get skin tone cluster (A1R)
-                for a1r_col in possible_a1r_columns:
-                    if a1r_col in row and pd.notna(row[a1r_col]):
-                        result['skin_tone_cluster'] = str(row[a1r_col]).strip()
-                        break
-                
-                logger.info(f"Found info for respondent {respondent_id}: Hair Tone={result['hair_tone']}, Skin Tone Cluster={result['skin_tone_cluster']}")
-                return result
-            
-            # Try partial match (if respondent_id is part of filename)
-            partial_matches = category_df[category_df[id_col].astype(str).str.contains(respondent_id_str, na=False)]
-            
-            if not partial_matches.empty:
-                row = partial_matches.iloc[0]
-                result['found'] = True
-                
-                # Get hair tone (category)
-                for cat_col in possible_category_columns:
-                    if cat_col in row and pd.notna(row[cat_col]):
-                        result['hair_tone'] = str(row[cat_col]).strip().title()
-                        break
-                
-                # Get skin tone cluster (A1R)
-                for a1r_col in possible_a1r_columns:
-                    if a1r_col in row and pd.notna(row[a1r_col]):
-                        result['skin_tone_cluster'] = str(row[a1r_col]).strip()
-                        break
-                
-                logger.info(f"Found info for respondent {respondent_id} (partial match): Hair Tone={result['hair_tone']}, Skin Tone Cluster={result['skin_tone_cluster']}")
-                return result
-    
-    logger.warning(f"No information found for respondent ID: {respondent_id}")
+    row, _, partial = _find_respondent_row(respondent_id_str)
+    
+    if row is not None:
+        result['found'] = True
+        
+        columns = _hair_category_columns()
+        
+        # Get hair tone (category)
+        for cat_col in columns['category']:
+            if pd.notna(row[cat_col]):
+                result['hair_tone'] = str(row[cat_col]).strip().title()
+                break
+        
+        # Get skin tone cluster (A1R)
+        for a1r_col in columns['a1r']:
+            if pd.notna(row[a1r_col]):
+                result['skin_tone_cluster'] = str(row[a1r_col]).strip()
+                break
+        
+        match_note = " (partial match)" if partial else ""
+        logger.info("Found info for respondent %s%s: Hair Tone=%s, Skin Tone Cluster=%s",
+                    respondent_id, match_note, result['hair_tone'], result['skin_tone_cluster'])
+        return result
+    
+    logger.warning("No information found for respondent ID: %s", respondent_id)
     return result
\ No newline at end of file
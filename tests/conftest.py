@@ -0,0 +1,11 @@
+"""Shared pytest setup: import the app modules without GCS credentials"""
+import sys
+from pathlib import Path
+from unittest import mock
+
+# Make `config` and `src` importable from the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# config.settings builds a storage.Client at import time, which needs credentials;
+# the tests never touch GCS, so the client is replaced before anything imports it
+mock.patch("google.cloud.storage.Client").start()
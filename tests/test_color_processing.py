@@ -0,0 +1,93 @@
+"""Equivalence checks for the vectorized hair mask decoding and color remapping"""
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+from PIL import Image
+
+from src import color_processing
+from src.color_processing import mask_to_bool, remap_hair_colors
+
+# Cluster colors close together, so many pixels are equidistant from two of them
+PALETTE = np.array([[10, 10, 10], [12, 10, 10], [10, 14, 10]], dtype=np.uint8)
+COLOR_DATA = pd.Series({f'{channel}_{i}': 0.0 for i in (1, 2, 3) for channel in ('L', 'a', 'b')})
+
+
+def _all_axis_mask(mask):
+    """Hair pixels as the original code decoded them"""
+    return (np.array(mask.convert("RGB")) != [0, 0, 0]).all(axis=2)
+
+
+def _per_pixel_remap(image, mask, cluster_centers):
+    """Remap as the original per-pixel find_closest_color loop did (first minimum wins)"""
+    image_np = np.array(image.convert("RGB"))
+    centers = cluster_centers.astype(int)
+    for y, x in zip(*np.where(_all_axis_mask(mask))):
+        distances = np.linalg.norm(centers - image_np[y, x], axis=1)
+        image_np[y, x] = centers[np.argmin(distances)]
+    return image_np
+
+
+@pytest.fixture
+def cpu_palette(monkeypatch):
+    """Fixed cluster colors on the NumPy (CPU) remap path"""
+    monkeypatch.setattr(color_processing, "lab_to_rgb", lambda lab_values: PALETTE.copy())
+    monkeypatch.setattr(color_processing, "device", torch.device("cpu"))
+
+
+def _random_mask_channels(shape, seed):
+    # 0 in any channel makes a pixel background, so draw plenty of zeros
+    return np.random.default_rng(seed).choice(np.array([0, 1, 128, 255], dtype=np.uint8), size=shape)
+
+
+@pytest.mark.parametrize("mode", ["1", "L", "LA", "P", "RGB", "RGBA"])
+def test_mask_to_bool_matches_all_axis_decode(mode):
+    channels = _random_mask_channels((24, 32, 4), seed=0)
+    if mode == "RGBA":
+        mask = Image.fromarray(channels, "RGBA")
+    elif mode == "LA":
+        mask = Image.fromarray(channels[:, :, :2], "LA")
+    else:
+        mask = Image.fromarray(channels[:, :, :3], "RGB").convert(mode)
+    
+    decoded = mask_to_bool(mask)
+    assert decoded.dtype == bool
+    assert decoded.flags['C_CONTIGUOUS']
+    np.testing.assert_array_equal(decoded, _all_axis_mask(mask))
+
+
+def _tie_image(height, width, seed):
+    pixels = np.random.default_rng(seed).integers(5, 18, size=(height, width, 3), dtype=np.uint8)
+    # (11, 10, 10) is exactly between the first two cluster colors
+    pixels[0, 0] = [11, 10, 10]
+    return Image.fromarray(pixels, "RGB")
+
+
+@pytest.mark.parametrize("block_pixels", [1, 7, 64, 256, color_processing.REMAP_BLOCK_PIXELS])
+def test_remap_matches_per_pixel_loop_across_block_sizes(cpu_palette, monkeypatch, block_pixels):
+    monkeypatch.setattr(color_processing, "REMAP_BLOCK_PIXELS", block_pixels)
+    image = _tie_image(16, 16, seed=1)
+    mask = Image.fromarray(_random_mask_channels((16, 16, 3), seed=2), "RGB")
+    mask.putpixel((0, 0), (255, 255, 255))
+    
+    expected = _per_pixel_remap(image, mask, PALETTE)
+    np.testing.assert_array_equal(np.array(remap_hair_colors(image, mask, COLOR_DATA)), expected)
+    np.testing.assert_array_equal(np.array(remap_hair_colors(image, mask_to_bool(mask), COLOR_DATA)), expected)
+    # Ties resolve to the first cluster color
+    np.testing.assert_array_equal(expected[0, 0], PALETTE[0])
+
+
+def test_remap_matches_per_pixel_loop_past_remap_block_pixels(cpu_palette):
+    # One full block plus a partial one, with the tie pixel right after the boundary
+    block_pixels = color_processing.REMAP_BLOCK_PIXELS
+    width = 256
+    height = block_pixels // width + 2
+    image = _tie_image(height, width, seed=3)
+    pixels = np.array(image)
+    pixels.reshape(-1, 3)[block_pixels] = [11, 10, 10]
+    image = Image.fromarray(pixels, "RGB")
+    mask = Image.new("L", image.size, 255)
+    
+    remapped = np.array(remap_hair_colors(image, mask, COLOR_DATA))
+    np.testing.assert_array_equal(remapped, _per_pixel_remap(image, mask, PALETTE))
+    np.testing.assert_array_equal(remapped.reshape(-1, 3)[block_pixels], PALETTE[0])
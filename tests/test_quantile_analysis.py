@@ -0,0 +1,114 @@
+"""Equivalence checks for the vectorized quantile binning and cell representatives"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.quantile_analysis import assign_quantile_bins, select_representative_samples_quantile
+
+
+def _pd_cut_bins(values, bins):
+    """Bin labels as the original code assigned them with pd.cut"""
+    labels = pd.cut(pd.Series(values, dtype=float), bins=bins, labels=False,
+                    include_lowest=True, duplicates='drop')
+    return labels.to_numpy(dtype=float)
+
+
+def _quantile_edges(values, grid_size=4):
+    quantiles = [i / grid_size for i in range(grid_size + 1)]
+    return pd.Series(values, dtype=float).quantile(quantiles).values
+
+
+@pytest.mark.parametrize("values", [
+    np.random.default_rng(0).normal(50, 15, 500),
+    # Heavy ties: several quantile edges coincide and get dropped
+    np.array([1, 1, 1, 1, 1, 1, 2, 2, 3, 3, 3, 4], dtype=float),
+    np.array([7, 7, 7, 7, 7, 7, 7, 9], dtype=float),
+    # A single distinct value leaves no interval
+    np.full(6, 5.0),
+])
+def test_assign_quantile_bins_matches_pd_cut_on_quantile_edges(values):
+    bins = _quantile_edges(values)
+    np.testing.assert_array_equal(
+        np.asarray(assign_quantile_bins(values, bins), dtype=float),
+        _pd_cut_bins(values, bins)
+    )
+
+
+def test_assign_quantile_bins_edges_and_outside_values():
+    bins = np.array([0.0, 1.0, 1.0, 2.0, 3.0])
+    # Every edge itself, values between edges, values outside the edges and NaN
+    values = np.array([0.0, 1.0, 2.0, 3.0, 0.5, 1.5, 2.5, -0.1, 3.1, np.nan])
+    labels = assign_quantile_bins(values, bins)
+    np.testing.assert_array_equal(np.asarray(labels, dtype=float), _pd_cut_bins(values, bins))
+    np.testing.assert_array_equal(labels[:4], [0, 0, 1, 2])
+    assert np.isnan(labels[-3:]).all()
+
+
+def test_assign_quantile_bins_returns_ints_when_all_values_fall_inside():
+    values = np.array([0.0, 0.5, 1.0, 2.0])
+    labels = assign_quantile_bins(values, [0.0, 1.0, 2.0])
+    assert labels.dtype.kind == 'i'
+    np.testing.assert_array_equal(labels, [0, 0, 0, 1])
+
+
+def _region_frame(lab, first_index=100):
+    lab = np.asarray(lab, dtype=float)
+    return pd.DataFrame({
+        'RESP_FINAL': np.arange(1, len(lab) + 1),
+        'VIDEOS': 'V1',
+        'L_main': lab[:, 0],
+        'a_main': lab[:, 1],
+        'b_main': lab[:, 2],
+    }, index=np.arange(first_index, first_index + len(lab)))
+
+
+def _cell_loop_representatives(df_lch, row_bin, col_bin, x_col, y_col, x_bins, y_bins, grid_size):
+    """Representatives as the original per-cell loop picked them: (cell) -> RESP_FINAL"""
+    selected = {}
+    for row_idx in range(grid_size):
+        for col_idx in range(grid_size):
+            cell_samples = df_lch[(df_lch[row_bin] == row_idx) & (df_lch[col_bin] == col_idx)]
+            if len(cell_samples) > 0:
+                x_center = (x_bins[row_idx] + x_bins[row_idx + 1]) / 2
+                y_center = (y_bins[col_idx] + y_bins[col_idx + 1]) / 2
+                dist = np.sqrt((cell_samples[x_col] - x_center) ** 2 + (cell_samples[y_col] - y_center) ** 2)
+                selected[(row_idx, col_idx)] = cell_samples.loc[dist.idxmin(), 'RESP_FINAL']
+    return selected
+
+
+def _check_representatives(df_region, grid_size=4):
+    result = select_representative_samples_quantile(df_region, 1, 'main', grid_size)
+    df_lch = result['all_samples'].copy()
+    bins = result['bins']
+    
+    # Rebin independently with pd.cut so the reference does not reuse the new binning
+    df_lch['L_bin'] = _pd_cut_bins(df_lch['L'], bins['L'])
+    df_lch['C_bin'] = _pd_cut_bins(df_lch['C'], bins['C'])
+    df_lch['h_bin'] = _pd_cut_bins(df_lch['h'], bins['h'])
+    
+    for grid_key, samples_key, y_col in (('lc_grid', 'lc_samples', 'C'), ('lh_grid', 'lh_samples', 'h')):
+        expected = _cell_loop_representatives(
+            df_lch, 'L_bin', f'{y_col}_bin', 'L', y_col, bins['L'], bins[y_col], grid_size
+        )
+        grid = result[grid_key]
+        assert list(grid) == list(expected)
+        assert {cell: row['RESP_FINAL'] for cell, row in grid.items()} == expected
+        assert result[samples_key]['RESP_FINAL'].tolist() == list(expected.values())
+    return result
+
+
+def test_representatives_match_per_cell_loop():
+    rng = np.random.default_rng(1)
+    lab = np.column_stack([rng.uniform(10, 60, 300), rng.normal(8, 4, 300), rng.normal(12, 5, 300)])
+    _check_representatives(_region_frame(lab))
+
+
+def test_representative_tie_keeps_first_row():
+    rng = np.random.default_rng(2)
+    lab = np.column_stack([rng.uniform(10, 60, 40), rng.normal(8, 4, 40), rng.normal(12, 5, 40)])
+    # Every sample appears twice, so every cell's closest distance is tied between two rows
+    result = _check_representatives(_region_frame(np.vstack([lab, lab])))
+    for grid_key in ('lc_grid', 'lh_grid'):
+        assert all(row['RESP_FINAL'] <= len(lab) for row in result[grid_key].values())
+    # The representative keeps its original index label
+    assert all(row['index'] == row['RESP_FINAL'] + 99 for row in result['lc_grid'].values())